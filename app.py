@@ -1,25 +1,45 @@
 import os
+import json
+import shutil
 import logging
-from flask import Flask, request, render_template, redirect, jsonify, send_from_directory, session
-from gbmodel import Model
-from utils.vision_utils import detect_objects, extract_objects
-from utils.translate_utils import translate_text, LANGUAGE_MAP
+import time
+from tempfile import SpooledTemporaryFile
+from flask import Flask, request, render_template, redirect, jsonify, send_from_directory, session, Response, stream_with_context, g
+from gbmodel import Model, ReviewQueues
+from utils.vision_utils import detect_objects, extract_objects, get_vision_client, create_detection_cache
+from werkzeug.utils import secure_filename
+from utils.upload_utils import SpooledRequest
+from utils.metrics_utils import REQUEST_SECONDS, METRICS_CONTENT_TYPE, render_metrics
+from utils.storage_utils import create_crop_storage, CropReaper, IMMUTABLE_MAX_AGE
+from utils.job_utils import create_job_store, JobRunner, JobQueueFull, DONE, FAILED
+from utils.translate_utils import TranslationClient, TranslationCache, create_translation_store, LANGUAGE_MAP
 
 app = Flask(__name__)
+app.request_class = SpooledRequest
 app.config['UPLOAD_FOLDER'] = 'uploads'
 app.config['EXTRACTED_FOLDER'] = 'extracted'
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16 MB max upload size
+app.config['UPLOAD_SPOOL_THRESHOLD'] = 4 * 1024 * 1024  # Spool larger uploads to a temp file
+app.config['PERSIST_UPLOADS'] = os.getenv('PERSIST_UPLOADS', '').lower() in ('1', 'true', 'yes')
+app.config['CROP_REAPER_INTERVAL'] = int(os.getenv('CROP_REAPER_INTERVAL', '3600'))  # Seconds, 0 disables
+app.config['CROP_GRACE_PERIOD'] = int(os.getenv('CROP_GRACE_PERIOD', '86400'))  # Keep new crops this long
+app.config['UPLOAD_ASYNC'] = os.getenv('UPLOAD_ASYNC', '').lower() in ('1', 'true', 'yes')
+app.config['UPLOAD_JOB_WORKERS'] = int(os.getenv('UPLOAD_JOB_WORKERS', '4'))
+app.config['UPLOAD_JOB_MAX_PENDING'] = int(os.getenv('UPLOAD_JOB_MAX_PENDING', '32'))
 app.secret_key = 'supersecretkey'
 
-# Ensure the upload and extracted directories exist
-os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
+# Ensure the extracted directory, and the upload directory if used, exist
+if app.config['PERSIST_UPLOADS']:
+    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 os.makedirs(app.config['EXTRACTED_FOLDER'], exist_ok=True)
 
-logging.basicConfig(level=logging.DEBUG)
+# Debug logging dumps whole request payloads, so it is opt-in
+logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
 
 # Set the path to your service account key file from an environment variable
 google_credentials_path = os.getenv('GOOGLE_APPLICATION_CREDENTIALS')
-os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = google_credentials_path
+if google_credentials_path:
+    os.environ["GOOGLE_APPLICATION_CREDENTIALS"] = google_credentials_path
 
 # Read the DeepL API key from the environment variable
 DEEPL_API_KEY = os.getenv('DEEPL_API_KEY')
@@ -28,6 +48,103 @@ DEEPL_API_KEY = os.getenv('DEEPL_API_KEY')
 project_id = 'cloud-lutz-benlutz-422823'
 datastore_model = Model(project_id)
 
+# Serve reviews from prefetched per-language queues of due words
+review_queues = ReviewQueues(datastore_model)
+
+# Store crops by content hash and periodically delete ones no missed word uses
+crop_storage = create_crop_storage(app.config['EXTRACTED_FOLDER'])
+crop_reaper = None
+if app.config['CROP_REAPER_INTERVAL'] > 0:
+    crop_reaper = CropReaper(crop_storage, datastore_model, interval=app.config['CROP_REAPER_INTERVAL'],
+                             grace_period=app.config['CROP_GRACE_PERIOD'])
+
+def start_background_tasks():
+    """Start the crop reaper in the serving process.
+
+    Never called at import: with gunicorn's preload_app that would run it in
+    the master before forking. gunicorn.conf.py calls this from the worker.
+    """
+    if crop_reaper is not None:
+        crop_reaper.start()
+
+# Cache detections by image hash; the shared Vision client is created on first use
+detection_cache = create_detection_cache(datastore_client=datastore_model.lazy_client)
+
+# Cache translations in memory, backed by SQLite locally or Datastore in prod
+translation_client = TranslationClient(DEEPL_API_KEY)
+translation_cache = TranslationCache(
+    translation_client, store=create_translation_store(datastore_client=datastore_model.lazy_client)
+)
+
+# Background processing for asynchronous uploads; job state is shared through
+# Datastore in production so any worker can answer /jobs
+upload_jobs = JobRunner(
+    create_job_store(datastore_client=datastore_model.lazy_client),
+    max_workers=app.config['UPLOAD_JOB_WORKERS'],
+    max_pending=app.config['UPLOAD_JOB_MAX_PENDING']
+)
+
+def object_response(obj, extracted):
+    return {
+        "name": obj.name,
+        "image_path": extracted["filename"],
+        "thumbnail_path": extracted["thumbnail"],
+        "width": extracted["width"],
+        "height": extracted["height"]
+    }
+
+def process_upload_job(job_id, buffer):
+    try:
+        objects = detect_objects(buffer, cache=detection_cache)
+
+        def publish(index, extracted):
+            upload_jobs.store.update(job_id, new_object=dict(object_response(objects[index], extracted), index=index))
+
+        extract_objects(buffer, objects, storage=crop_storage, on_object=publish)
+    finally:
+        buffer.close()
+
+def wants_async_upload():
+    value = request.args.get('async', request.form.get('async'))
+    if value is None:
+        return app.config['UPLOAD_ASYNC']
+    return value.lower() in ('1', 'true', 'yes')
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_duration(response):
+    started = g.pop('request_started', None)
+    if started is not None:
+        endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint,
+                                method=request.method, status=response.status_code)
+    return response
+
+@app.route('/healthz')
+def healthz():
+    return jsonify({"status": "ok"})
+
+@app.route('/readyz')
+def readyz():
+    # Build this worker's shared clients and cache connections so the first real request doesn't pay for it
+    try:
+        get_vision_client()
+        if datastore_model.lazy_client is not None:
+            datastore_model.lazy_client.get()
+        translation_cache.warm_up()
+        detection_cache.warm_up()
+    except Exception as e:
+        app.logger.error("Readiness check failed: %s", e)
+        return jsonify({"status": "unavailable", "error": str(e)}), 503
+    return jsonify({"status": "ready"})
+
+@app.route('/metrics')
+def metrics():
+    return Response(render_metrics(), content_type=METRICS_CONTENT_TYPE)
+
 @app.route('/')
 def index():
     language = session.get('language', 'BG')
@@ -45,25 +162,90 @@ def upload_image():
         app.logger.error("No selected file")
         return redirect(request.url)
     if file:
-        file_path = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
+        if wants_async_upload():
+            return start_upload_job(file)
         try:
-            app.logger.info(f"Saving file to {file_path}")
-            file.save(file_path)
-            objects = detect_objects(file_path)
-            extracted_objects = extract_objects(file_path, objects)
-            object_names = [obj.name for obj in objects]
+            # The upload was parsed into one spooled buffer; Vision and PIL both read from it
+            objects = detect_objects(file.stream, cache=detection_cache)
+            extracted_objects = extract_objects(file.stream, objects, storage=crop_storage)
+            if app.config['PERSIST_UPLOADS']:
+                file_path = os.path.join(app.config['UPLOAD_FOLDER'], secure_filename(file.filename))
+                app.logger.info("Saving file to %s", file_path)
+                file.stream.seek(0)
+                file.save(file_path)
             response_data = {
-                "objects": [{"name": name, "image_path": path} for name, path in zip(object_names, extracted_objects)]
+                "objects": [object_response(obj, extracted) for obj, extracted in zip(objects, extracted_objects)]
             }
             return jsonify(response_data)
         except Exception as e:
-            app.logger.error(f"Error processing file: {e}")
+            app.logger.error("Error processing file: %s", e)
             return redirect(request.url)
     return redirect(request.url)
 
+def start_upload_job(file):
+    # Werkzeug closes the request's files when it ends, so the job gets its own copy
+    buffer = SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_THRESHOLD'], mode='w+b')
+    file.stream.seek(0)
+    shutil.copyfileobj(file.stream, buffer)
+    try:
+        job_id = upload_jobs.submit(process_upload_job, buffer)
+    except JobQueueFull as e:
+        buffer.close()
+        app.logger.error("Rejecting upload: %s", e)
+        return jsonify({"error": str(e)}), 503
+    return jsonify({
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events"
+    }), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+    job = upload_jobs.store.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/events')
+def job_events(job_id):
+    if upload_jobs.store.get(job_id) is None:
+        return jsonify({"error": "Unknown job"}), 404
+
+    def events():
+        sent = 0
+        while True:
+            job = upload_jobs.store.wait(job_id, sent, timeout=15)
+            if job is None:
+                yield "event: error\ndata: {\"error\": \"Unknown job\"}\n\n"
+                return
+            new_objects = job['objects'][sent:]
+            for obj in new_objects:
+                yield f"event: object\ndata: {json.dumps(obj)}\n\n"
+            sent = len(job['objects'])
+            if job['status'] == DONE:
+                yield "event: done\ndata: {}\n\n"
+                return
+            if job['status'] == FAILED:
+                yield f"event: error\ndata: {json.dumps({'error': job['error']})}\n\n"
+                return
+            if not new_objects:
+                # Comment line keeps idle proxies from closing the stream
+                yield ": keep-alive\n\n"
+
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 @app.route('/extracted/<filename>')
 def extracted_file(filename):
-    return send_from_directory(app.config['EXTRACTED_FOLDER'], filename)
+    public_url = crop_storage.public_url(filename)
+    if public_url:
+        return redirect(public_url, code=301)
+    # The name is the content hash, so it doubles as the ETag; send_file handles conditional and Range requests
+    response = send_from_directory(app.config['EXTRACTED_FOLDER'], filename, max_age=IMMUTABLE_MAX_AGE,
+                                   conditional=True, etag=os.path.splitext(filename)[0])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
 
 @app.route('/check_translations', methods=['POST'])
 def check_translations():
@@ -73,47 +255,59 @@ def check_translations():
             app.logger.error("No JSON data received")
             return jsonify({"error": "No JSON data received"}), 400
         
-        app.logger.debug(f"Received JSON data: {data}")
+        app.logger.debug("Received JSON data: %s", data)
 
         words = data.get('words')
         guesses = data.get('guesses')
         image_paths = data.get('image_paths')
         language = data.get('language')
 
-        app.logger.debug(f"Received words: {words}")
-        app.logger.debug(f"Received guesses: {guesses}")
-        app.logger.debug(f"Received image_paths: {image_paths}")
-        app.logger.debug(f"Received language: {language}")
+        app.logger.debug("Received words: %s", words)
+        app.logger.debug("Received guesses: %s", guesses)
+        app.logger.debug("Received image_paths: %s", image_paths)
+        app.logger.debug("Received language: %s", language)
 
         if not words or not guesses or not image_paths or not language:
             app.logger.error("Missing data in the request")
             return jsonify({"error": "Missing data"}), 400
         
         results = []
-        for word, guess, image_path in zip(words, guesses, image_paths):
-            try:
-                correct_translation = translate_text(word, language, DEEPL_API_KEY)
-                if guess.lower() == correct_translation.lower():
-                    results.append({"word": word, "guess": guess, "result": "Correct"})
-                else:
-                    results.append({"word": word, "guess": guess, "result": f"Incorrect - Correct: {correct_translation}"})
-                    # Save missed words to datastore
-                    app.logger.debug(f"Adding missed word: language={language}, img_path={image_path}, english_word={word}, translation={correct_translation}")
-                    datastore_model.add_missed_word(language, image_path, word, correct_translation)
-            except ValueError as e:
-                app.logger.error(f"Translation error for word '{word}': {e}")
-                results.append({"word": word, "guess": guess, "result": f"Error - {str(e)}"})
+        missed_words = []
+        try:
+            translations = translation_cache.translate_many(words, language)
+        except ValueError as e:
+            app.logger.error("Translation error for words %s: %s", words, e)
+            return jsonify([{"word": word, "guess": guess, "result": f"Error - {str(e)}"}
+                            for word, guess in zip(words, guesses)])
+
+        for word, guess, image_path, correct_translation in zip(words, guesses, image_paths, translations):
+            if guess.lower() == correct_translation.lower():
+                results.append({"word": word, "guess": guess, "result": "Correct"})
+            else:
+                results.append({"word": word, "guess": guess, "result": f"Incorrect - Correct: {correct_translation}"})
+                app.logger.debug("Adding missed word: language=%s, img_path=%s, english_word=%s, translation=%s", language, image_path, word, correct_translation)
+                missed_words.append({
+                    'language': language,
+                    'image_path': image_path,
+                    'english_word': word,
+                    'translation': correct_translation
+                })
+
+        # Save all missed words to datastore in one batch
+        if missed_words:
+            datastore_model.add_missed_words(missed_words)
+            review_queues.invalidate(language)
         
         return jsonify(results)
     except Exception as e:
-        app.logger.error(f"Error in check_translations: {e}")
+        app.logger.error("Error in check_translations: %s", e)
         return jsonify({"error": str(e)}), 500
 
 @app.route('/review_missed_words', methods=['POST'])
 def review_missed_words():
     language = request.json.get('language')
-    missed_words = datastore_model.get_missed_words(language)
-    app.logger.debug(f"Missed words retrieved: {missed_words}")
+    missed_words = review_queues.next_batch(language)
+    app.logger.debug("Missed words retrieved: %s", missed_words)
 
     # Ensure the response is in the correct format for the frontend
     response = []
@@ -125,10 +319,11 @@ def review_missed_words():
             'image_path': word['image_path'],
             'language': word['language'],
             'timestamp': word['timestamp'].isoformat() if word.get('timestamp') else '',
+            'due_at': word['due_at'].isoformat() if word.get('due_at') else '',
             'translation': word['translation']
         })
     
-    app.logger.debug(f"Sending response: {response}")
+    app.logger.debug("Sending response: %s", response)
     return jsonify(response)
 
 @app.route('/review_guess', methods=['POST'])
@@ -136,18 +331,17 @@ def review_guess():
     entity_keys = request.form.getlist('entity_keys')
     guesses = request.form.getlist('guesses')
     results = []
-    for entity_key_str, guess in zip(entity_keys, guesses):
-        entity_key = datastore_model.client.key('MissedWord', int(entity_key_str))
-        entity = datastore_model.client.get(entity_key)
-        if entity:
-            correct_translation = entity['translation']
-            if guess.lower() == correct_translation.lower():
-                datastore_model.increment_correct_guess(entity_key)
-                results.append({"word": entity['english_word'], "guess": guess, "result": "Correct"})
-            else:
-                results.append({"word": entity['english_word'], "guess": guess, "result": f"Incorrect - Correct: {correct_translation}"})
+    graded_words = datastore_model.grade_reviews(entity_keys, guesses)
+    for language in {graded['language'] for graded in graded_words}:
+        review_queues.invalidate(language)
+    for graded in graded_words:
+        if graded['correct']:
+            results.append({"word": graded['english_word'], "guess": graded['guess'], "result": "Correct"})
+        else:
+            results.append({"word": graded['english_word'], "guess": graded['guess'], "result": f"Incorrect - Correct: {graded['translation']}"})
     return jsonify(results)
 
 
 if __name__ == '__main__':
+    start_background_tasks()
     app.run(host='0.0.0.0', port=8080)
@@ -0,0 +1,228 @@
+"""Offline benchmark for the Flask app.
+
+Drives /upload, /check_translations and the review endpoints through
+Flask's test client. Vision, DeepL and Datastore are replaced by local
+stubs with configurable latency, so no credentials or network access are
+needed. Reports throughput and p50/p99 latency per scenario, and can fail
+when results regress against a saved baseline:
+
+    python benchmarks/bench_app.py --requests 200 --concurrency 8 --output bench.json
+    python benchmarks/bench_app.py --baseline bench.json --max-regression 0.2
+"""
+import argparse
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+OBJECT_NAMES = ['Person', 'Car', 'Chair', 'Table', 'Dog', 'Cat', 'Bicycle', 'Cup']
+
+
+class StubVisionClient:
+    """Returns a few fixed boxes for every image after a simulated delay."""
+
+    def __init__(self, latency, objects_per_image=5):
+        self.latency = latency
+        self.objects_per_image = objects_per_image
+
+    def object_localization(self, image):
+        time.sleep(self.latency)
+        annotations = []
+        for index, name in enumerate(OBJECT_NAMES[:self.objects_per_image]):
+            x0, y0 = 0.1 * index, 0.05 * index
+            vertices = [SimpleNamespace(x=x, y=y) for x, y in ((x0, y0), (x0 + 0.4, y0), (x0 + 0.4, y0 + 0.5), (x0, y0 + 0.5))]
+            annotations.append(SimpleNamespace(name=name, score=0.9,
+                                               bounding_poly=SimpleNamespace(normalized_vertices=vertices)))
+        return SimpleNamespace(localized_object_annotations=annotations)
+
+
+def start_deepl_stub(latency):
+    """Serve a DeepL-compatible /v2/translate on localhost and return its URL."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            time.sleep(latency)
+            form = parse_qs(self.rfile.read(int(self.headers['Content-Length'])).decode())
+            body = json.dumps({'translations': [{'text': text[::-1]} for text in form.get('text', [])]}).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_port}/v2/translate'
+
+
+def make_images(count, size):
+    """Generate distinct photo-like JPEGs so the detection cache doesn't hide the Vision stub."""
+    from PIL import Image, ImageDraw
+    rng = random.Random(0)
+    images = []
+    for _ in range(count):
+        image = Image.merge('RGB', [Image.linear_gradient('L').resize(size).rotate(rng.randrange(360))] * 3)
+        draw = ImageDraw.Draw(image)
+        for _ in range(40):
+            x, y = rng.randrange(size[0]), rng.randrange(size[1])
+            box = (x, y, x + rng.randrange(20, size[0] // 3), y + rng.randrange(20, size[1] // 3))
+            draw.ellipse(box, fill=tuple(rng.randrange(256) for _ in range(3)))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+
+def load_app(args):
+    # Everything the app writes (crops, caches) goes to a scratch directory
+    os.chdir(tempfile.mkdtemp(prefix='bench-'))
+    os.environ.update({
+        'MODEL_BACKEND': 'memory',
+        'TRANSLATION_CACHE_BACKEND': 'none' if args.no_cache else 'sqlite',
+        'VISION_CACHE_BACKEND': 'none',
+        'DEEPL_API_URL': start_deepl_stub(args.deepl_latency / 1000),
+        'CROP_REAPER_INTERVAL': '0',
+        'LOG_LEVEL': 'WARNING',
+    })
+    os.environ.setdefault('GOOGLE_APPLICATION_CREDENTIALS', '')
+    sys.path.insert(0, REPO_ROOT)
+
+    import utils.vision_utils as vision_utils
+    vision_utils.vision_client.set(StubVisionClient(args.vision_latency / 1000))
+    import app as app_module
+    return app_module
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))
+    return ordered[index]
+
+
+def run_scenario(name, requests, concurrency, fn):
+    latencies = []
+    errors = 0
+    lock = threading.Lock()
+
+    def one(index):
+        nonlocal errors
+        started = time.perf_counter()
+        ok = fn(index)
+        elapsed = time.perf_counter() - started
+        with lock:
+            latencies.append(elapsed)
+            if not ok:
+                errors += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(one, range(requests)))
+    wall = time.perf_counter() - started
+    return {
+        'scenario': name,
+        'requests': requests,
+        'errors': errors,
+        'throughput': requests / wall,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=100, help='requests per scenario')
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--vision-latency', type=float, default=150, help='stub Vision latency in ms')
+    parser.add_argument('--deepl-latency', type=float, default=80, help='stub DeepL latency in ms')
+    parser.add_argument('--image-size', type=int, nargs=2, default=(1600, 1200))
+    parser.add_argument('--no-cache', action='store_true', help='disable the persistent translation cache')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--baseline', help='compare against results saved with --output')
+    parser.add_argument('--max-regression', type=float, default=0.2,
+                        help='allowed fractional p50/p99 increase over the baseline')
+    parser.add_argument('--metrics', action='store_true', help='print the /metrics output afterwards')
+    args = parser.parse_args()
+    # load_app changes directory, so resolve file arguments first
+    output = os.path.abspath(args.output) if args.output else None
+    baseline_path = os.path.abspath(args.baseline) if args.baseline else None
+
+    app_module = load_app(args)
+    app = app_module.app
+    images = make_images(min(args.requests, 32), tuple(args.image_size))
+    words = OBJECT_NAMES[:5]
+
+    def upload(index):
+        client = app.test_client()
+        data = {'file': (io.BytesIO(images[index % len(images)]), f'bench_{index}.jpg'), 'language': 'DE'}
+        return client.post('/upload', data=data).status_code == 200
+
+    def check_translations(index):
+        client = app.test_client()
+        payload = {
+            'words': words,
+            'guesses': [random.choice([word[::-1], 'wrong']) for word in words],
+            'image_paths': [f'bench_{index}_{i}.jpg' for i in range(len(words))],
+            'language': 'DE',
+        }
+        return client.post('/check_translations', json=payload).status_code == 200
+
+    def review(index):
+        client = app.test_client()
+        response = client.post('/review_missed_words', json={'language': 'DE'})
+        if response.status_code != 200:
+            return False
+        due = response.get_json()
+        if not due:
+            return True
+        form = {'entity_keys': [word['id'] for word in due], 'guesses': [word['translation'] for word in due]}
+        return client.post('/review_guess', data=form).status_code == 200
+
+    results = [
+        run_scenario('upload', args.requests, args.concurrency, upload),
+        run_scenario('check_translations', args.requests, args.concurrency, check_translations),
+        run_scenario('review', args.requests, args.concurrency, review),
+    ]
+
+    print(f"{'scenario':<20} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8}")
+    for result in results:
+        print(f"{result['scenario']:<20} {result['requests']:>8} {result['errors']:>6} "
+              f"{result['throughput']:>8.1f} {result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f}")
+
+    if args.metrics:
+        print(app.test_client().get('/metrics').get_data(as_text=True))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    failed = any(result['errors'] for result in results)
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = {result['scenario']: result for result in json.load(f)}
+        for result in results:
+            previous = baseline.get(result['scenario'])
+            if previous is None:
+                continue
+            for metric in ('p50_ms', 'p99_ms'):
+                limit = previous[metric] * (1 + args.max_regression)
+                if result[metric] > limit:
+                    print(f"REGRESSION {result['scenario']} {metric}: {result[metric]:.1f} > {limit:.1f}")
+                    failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
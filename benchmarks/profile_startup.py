@@ -0,0 +1,59 @@
+"""Profile how long it takes to import the app, and which imports dominate.
+
+Runs `python -X importtime -c "import wsgi"` in a fresh interpreter and
+prints the total time along with the slowest imports by cumulative time,
+so slow top-level imports can be spotted and deferred:
+
+    python benchmarks/profile_startup.py --top 25
+"""
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+IMPORTTIME_LINE = re.compile(r'import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)')
+
+
+def profile(module):
+    env = dict(os.environ, CROP_REAPER_INTERVAL='0')
+    started = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+                            cwd=REPO_ROOT, env=env, capture_output=True, text=True)
+    wall = time.perf_counter() - started
+    if result.returncode != 0:
+        sys.stderr.write(result.stderr)
+        sys.exit(result.returncode)
+
+    imports = []
+    for line in result.stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, name = match.groups()
+            # importtime indents nested imports by two spaces per level
+            imports.append((int(cumulative_us), int(self_us), len(indent) // 2, name))
+    return wall, imports
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--module', default='wsgi', help='module to import')
+    parser.add_argument('--top', type=int, default=20, help='number of imports to show')
+    parser.add_argument('--top-level-only', action='store_true',
+                        help='only show imports made directly by the app')
+    args = parser.parse_args()
+
+    wall, imports = profile(args.module)
+    if args.top_level_only:
+        imports = [item for item in imports if item[2] <= 1]
+    print(f"Interpreter start + import {args.module}: {wall * 1000:.0f} ms")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    for cumulative_us, self_us, _, name in sorted(imports, reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,3 +1,12 @@
-model_backend = 'datastore'
+import os
 
-from .model_datastore import Model
+model_backend = os.getenv('MODEL_BACKEND', 'datastore')
+
+if model_backend == 'datastore':
+    from .model_datastore import Model
+elif model_backend == 'memory':
+    from .model_memory import Model
+else:
+    raise ValueError(f"Unknown model backend: {model_backend}")
+
+from .scheduler import ReviewQueues
@@ -0,0 +1,29 @@
+"""Give MissedWord entities stored before review scheduling a due_at.
+
+Reviews only return words with a due_at, so run this once when deploying
+scheduling, otherwise words missed before then never come up for review:
+
+    python -m gbmodel.backfill --project cloud-lutz-benlutz-422823
+
+It is safe to run again; words that already have a schedule are skipped.
+"""
+import argparse
+import logging
+import os
+
+from .model_datastore import Model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--project', default=os.getenv('GOOGLE_CLOUD_PROJECT', 'cloud-lutz-benlutz-422823'))
+    parser.add_argument('--batch-size', type=int, default=500, help='entities per put_multi call')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=os.getenv('LOG_LEVEL', 'INFO').upper())
+    updated = Model(args.project).backfill_schedule(batch_size=args.batch_size)
+    logging.info("Scheduled %s missed words", updated)
+
+
+if __name__ == '__main__':
+    main()
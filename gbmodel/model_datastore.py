@@ -1,53 +1,186 @@
+import base64
 from datetime import datetime
-from google.cloud import datastore
 import logging
 
+from utils.metrics_utils import timed
+from utils.client_utils import LazyClient
+from .scheduler import initial_schedule, schedule_review, is_learned, is_due
+
+# Scheduling state that is only ever read, never filtered or sorted on
+UNINDEXED_PROPERTIES = ('ease', 'interval', 'repetitions')
+
+# Properties returned by get_due_words; must match the composite index in index.yaml
+MISSED_WORD_PROJECTION = ['due_at', 'timestamp', 'correct_guesses', 'english_word', 'image_path', 'translation']
+
 class Model:
-    def __init__(self, project_id):
-        self.client = datastore.Client(project=project_id)
+    def __init__(self, project_id, client=None):
+        self.project_id = project_id
+        # Created on first use, once per worker process
+        self.lazy_client = LazyClient(self._create_client)
+        if client is not None:
+            self.lazy_client.set(client)
+
+    def _create_client(self):
+        # Honors DATASTORE_EMULATOR_HOST, so the emulator can stand in for Datastore
+        from google.cloud import datastore
+        return datastore.Client(project=self.project_id)
+
+    @property
+    def client(self):
+        return self.lazy_client.get()
 
     def add_missed_word(self, language, img_path, english_word, translation):
-        logging.debug(f"add_missed_word called with language={language}, img_path={img_path}, english_word={english_word}, translation={translation}")
-        if not img_path:
-            logging.error("Image path is None or empty, skipping add_missed_word.")
-            return  # Ensure img_path is not None or empty
-        entity_key = self.client.key('MissedWord')
-        entity = datastore.Entity(key=entity_key)
-        entity.update({
+        self.add_missed_words([{
             'language': language,
             'image_path': img_path,
             'english_word': english_word,
-            'translation': translation,
-            'correct_guesses': 0,
-            'timestamp': datetime.now()
-        })
-        self.client.put(entity)
-        logging.debug("Missed word added to Datastore successfully.")
+            'translation': translation
+        }])
+
+    def add_missed_words(self, words):
+        """Store several missed words with a single put_multi call.
+
+        Each word is a dict with language, image_path, english_word and translation.
+        """
+        from google.cloud import datastore
+        entities = []
+        now = datetime.now()
+        for word in words:
+            logging.debug("add_missed_words got %s", word)
+            if not word.get('image_path'):
+                logging.error("Image path is None or empty, skipping missed word.")
+                continue  # Ensure img_path is not None or empty
+            entity = datastore.Entity(key=self.client.key('MissedWord'), exclude_from_indexes=UNINDEXED_PROPERTIES)
+            entity.update({
+                'language': word['language'],
+                'image_path': word['image_path'],
+                'english_word': word['english_word'],
+                'translation': word['translation'],
+                'correct_guesses': 0,
+                'timestamp': now
+            })
+            entity.update(initial_schedule(now))
+            entities.append(entity)
+        if entities:
+            with timed('datastore_put_multi'):
+                self.client.put_multi(entities)
+            logging.debug("%s missed words added to Datastore successfully.", len(entities))
 
     def get_missed_words(self, language, limit=5):
+        missed_words, _ = self.get_due_words(language, limit=limit)
+        return missed_words
+
+    def get_due_words(self, language, limit=5, cursor=None, now=None):
+        """Return words due for review, soonest first, and a cursor for the next page.
+
+        Served by the (language, due_at) composite index, so each page is a
+        single index scan. The cursor is None once there are no more words.
+        """
         query = self.client.query(kind='MissedWord')
         query.add_filter('language', '=', language)
-        query.order = ['timestamp']
-        results = list(query.fetch(limit=limit))
+        query.add_filter('due_at', '<=', now or datetime.now())
+        query.projection = MISSED_WORD_PROJECTION
+        query.order = ['due_at']
+        start_cursor = base64.urlsafe_b64decode(cursor) if cursor else None
+        with timed('datastore_query_due_words'):
+            iterator = query.fetch(limit=limit, start_cursor=start_cursor)
+            page = list(next(iterator.pages))
         missed_words = []
-        for result in results:
+        for result in page:
             missed_word = {
                 'key': result.key,
-                'language': result['language'],
+                'language': language,  # Equality-filtered properties can't be projected
                 'image_path': result['image_path'],
                 'english_word': result['english_word'],
                 'translation': result['translation'],
                 'correct_guesses': result['correct_guesses'],
+                'due_at': result['due_at'],
                 'timestamp': result.get('timestamp')  # Retrieve the timestamp field
             }
             missed_words.append(missed_word)
-        return missed_words
+        next_cursor = iterator.next_page_token
+        if len(missed_words) < limit or not next_cursor:
+            return missed_words, None
+        return missed_words, base64.urlsafe_b64encode(next_cursor).decode('ascii')
+
+    def get_referenced_image_paths(self):
+        """Return every distinct image_path still stored on a MissedWord."""
+        query = self.client.query(kind='MissedWord')
+        query.projection = ['image_path']
+        query.distinct_on = ['image_path']
+        with timed('datastore_query_image_paths'):
+            return {result['image_path'] for result in query.fetch()}
+
+    def backfill_schedule(self, batch_size=500):
+        """Give words stored before scheduling existed a due_at so reviews can find them.
+
+        Run with python -m gbmodel.backfill. Returns the number of words updated.
+        """
+        query = self.client.query(kind='MissedWord')
+        pending = []
+        updated = 0
+        for entity in query.fetch():
+            if entity.get('due_at') is None:
+                entity.update(initial_schedule(entity.get('timestamp')))
+                entity.exclude_from_indexes.update(UNINDEXED_PROPERTIES)
+                pending.append(entity)
+                updated += 1
+            if len(pending) >= batch_size:
+                with timed('datastore_put_multi'):
+                    self.client.put_multi(pending)
+                pending = []
+        if pending:
+            with timed('datastore_put_multi'):
+                self.client.put_multi(pending)
+        return updated
 
     def increment_correct_guess(self, entity_key):
-        entity = self.client.get(entity_key)
-        if entity:
-            entity['correct_guesses'] += 1
-            if entity['correct_guesses'] >= 3:
-                self.client.delete(entity_key)
-            else:
-                self.client.put(entity)
+        self.grade_reviews([entity_key.id], [None], force_correct=True)
+
+    def grade_reviews(self, entity_ids, guesses, force_correct=False):
+        """Check review guesses against stored translations in one transaction.
+
+        Reads every entity with get_multi, reschedules each one, then writes
+        them with put_multi and removes learned words with delete_multi.
+        Words that are not due yet, e.g. from a resubmitted form or a stale
+        review queue, are checked but left unchanged.
+        Returns one dict per known entity, in request order, with language,
+        english_word, translation, guess and correct.
+        """
+        keys = [self.client.key('MissedWord', int(entity_id)) for entity_id in entity_ids]
+        now = datetime.now()
+        results = []
+        with timed('datastore_grade_transaction'), self.client.transaction():
+            with timed('datastore_get_multi'):
+                entities = {entity.key.id: entity for entity in self.client.get_multi(keys)}
+            # Keyed by id so a word reviewed twice is only written once; the
+            # first review makes it not due, so a repeat leaves it alone
+            to_put = {}
+            to_delete = {}
+            for key, guess in zip(keys, guesses):
+                entity = entities.get(key.id)
+                if entity is None:
+                    continue
+                correct = force_correct or guess.lower() == entity['translation'].lower()
+                if is_due(entity, now):
+                    if correct:
+                        entity['correct_guesses'] += 1
+                    schedule = schedule_review(entity, correct, now)
+                    entity.update(schedule)
+                    if is_learned(schedule):
+                        to_delete[key.id] = entity.key
+                    else:
+                        to_put[key.id] = entity
+                results.append({
+                    'language': entity['language'],
+                    'english_word': entity['english_word'],
+                    'translation': entity['translation'],
+                    'guess': guess,
+                    'correct': correct
+                })
+            # Buffered by the transaction and sent with its commit
+            if to_put:
+                self.client.put_multi(list(to_put.values()))
+            if to_delete:
+                self.client.delete_multi(list(to_delete.values()))
+        return results
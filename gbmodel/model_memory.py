@@ -0,0 +1,95 @@
+from collections import namedtuple
+from datetime import datetime
+import itertools
+import threading
+import logging
+
+from .scheduler import initial_schedule, schedule_review, is_learned, is_due
+
+# Stands in for a datastore.Key; callers only rely on .id
+MemoryKey = namedtuple('MemoryKey', ['kind', 'id'])
+
+class Model:
+    """In-process stand-in for the Datastore model, for local runs and benchmarks."""
+
+    def __init__(self, project_id=None, client=None):
+        self.client = client
+        self.lazy_client = None
+        self._entities = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def add_missed_word(self, language, img_path, english_word, translation):
+        self.add_missed_words([{
+            'language': language,
+            'image_path': img_path,
+            'english_word': english_word,
+            'translation': translation
+        }])
+
+    def add_missed_words(self, words):
+        now = datetime.now()
+        with self._lock:
+            for word in words:
+                if not word.get('image_path'):
+                    logging.error("Image path is None or empty, skipping missed word.")
+                    continue
+                key = MemoryKey('MissedWord', next(self._ids))
+                self._entities[key.id] = {
+                    'key': key,
+                    'language': word['language'],
+                    'image_path': word['image_path'],
+                    'english_word': word['english_word'],
+                    'translation': word['translation'],
+                    'correct_guesses': 0,
+                    'timestamp': now
+                }
+                self._entities[key.id].update(initial_schedule(now))
+
+    def get_missed_words(self, language, limit=5):
+        missed_words, _ = self.get_due_words(language, limit=limit)
+        return missed_words
+
+    def get_due_words(self, language, limit=5, cursor=None, now=None):
+        # The cursor is just an offset into the due list
+        now = now or datetime.now()
+        offset = int(cursor) if cursor else 0
+        with self._lock:
+            words = [dict(word) for word in self._entities.values()
+                     if word['language'] == language and word['due_at'] <= now]
+        words.sort(key=lambda word: word['due_at'])
+        page = words[offset:offset + limit]
+        next_cursor = str(offset + limit) if offset + limit < len(words) else None
+        return page, next_cursor
+
+    def get_referenced_image_paths(self):
+        with self._lock:
+            return {word['image_path'] for word in self._entities.values()}
+
+    def increment_correct_guess(self, entity_key):
+        self.grade_reviews([entity_key.id], [None], force_correct=True)
+
+    def grade_reviews(self, entity_ids, guesses, force_correct=False):
+        now = datetime.now()
+        results = []
+        with self._lock:
+            for entity_id, guess in zip(entity_ids, guesses):
+                entity = self._entities.get(int(entity_id))
+                if entity is None:
+                    continue
+                correct = force_correct or guess.lower() == entity['translation'].lower()
+                if is_due(entity, now):
+                    if correct:
+                        entity['correct_guesses'] += 1
+                    schedule = schedule_review(entity, correct, now)
+                    entity.update(schedule)
+                    if is_learned(schedule):
+                        del self._entities[entity['key'].id]
+                results.append({
+                    'language': entity['language'],
+                    'english_word': entity['english_word'],
+                    'translation': entity['translation'],
+                    'guess': guess,
+                    'correct': correct
+                })
+        return results
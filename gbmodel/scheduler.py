@@ -0,0 +1,112 @@
+from datetime import datetime, timedelta
+import threading
+import time
+
+# SM-2 defaults for a newly missed word
+DEFAULT_EASE = 2.5
+MIN_EASE = 1.3
+
+# A word answered wrongly comes back in the same session
+RETRY_DELAY = timedelta(minutes=10)
+
+# Words whose interval grows past this are considered learned and retired
+MAX_INTERVAL_DAYS = 180
+
+# SM-2 answer quality used for a correct and an incorrect guess
+CORRECT_QUALITY = 4
+INCORRECT_QUALITY = 1
+
+def initial_schedule(now=None):
+    """Scheduling fields for a word that was just missed; it is due right away."""
+    return {
+        'ease': DEFAULT_EASE,
+        'interval': 0,
+        'repetitions': 0,
+        'due_at': now or datetime.now()
+    }
+
+def schedule_review(word, correct, now=None):
+    """Apply one SM-2 step to a word's scheduling fields and return the new ones.
+
+    interval is in days. Words missing the fields (stored before scheduling
+    existed) are treated as new.
+    """
+    now = now or datetime.now()
+    ease = word.get('ease') or DEFAULT_EASE
+    interval = word.get('interval') or 0
+    repetitions = word.get('repetitions') or 0
+    quality = CORRECT_QUALITY if correct else INCORRECT_QUALITY
+
+    ease = max(MIN_EASE, ease + 0.1 - (5 - quality) * (0.08 + (5 - quality) * 0.02))
+    if quality < 3:
+        repetitions = 0
+        interval = 0
+        due_at = now + RETRY_DELAY
+    else:
+        repetitions += 1
+        if repetitions == 1:
+            interval = 1
+        elif repetitions == 2:
+            interval = 6
+        else:
+            interval = round(interval * ease)
+        due_at = now + timedelta(days=interval)
+    return {'ease': ease, 'interval': interval, 'repetitions': repetitions, 'due_at': due_at}
+
+def is_learned(schedule):
+    return schedule['interval'] > MAX_INTERVAL_DAYS
+
+def is_due(word, now=None):
+    """Whether a word may be graded; words without a due_at are treated as new."""
+    due_at = word.get('due_at')
+    return due_at is None or due_at <= (now or datetime.now())
+
+
+class ReviewQueues:
+    """Per-language queues of due words, prefetched a page at a time.
+
+    Each language keeps a list filled from the model's cursor-paginated
+    get_due_words, so most review requests are served without a query.
+    next_batch returns the head of the queue without removing it; words
+    only leave when the queue is invalidated because words in that
+    language were added or graded, or after ttl seconds.
+
+    Queues are per process, so another gunicorn worker may keep serving a
+    word graded elsewhere until its ttl runs out; grade_reviews ignores
+    words that are not due, so grading it again changes nothing.
+    """
+
+    def __init__(self, model, prefetch=50, ttl=60):
+        self.model = model
+        self.prefetch = prefetch
+        self.ttl = ttl
+        self._queues = {}
+        self._language_locks = {}
+        self._lock = threading.Lock()
+
+    def _language_lock(self, language):
+        with self._lock:
+            return self._language_locks.setdefault(language, threading.Lock())
+
+    def next_batch(self, language, size=5):
+        # The per-language lock keeps concurrent requests from fetching the same
+        # page twice, without serializing fetches for other languages
+        with self._language_lock(language):
+            with self._lock:
+                queue = self._queues.get(language)
+                if queue is None or queue['expires_at'] < time.monotonic():
+                    queue = {'words': [], 'cursor': None, 'now': datetime.now(),
+                             'exhausted': False, 'expires_at': time.monotonic() + self.ttl}
+                    self._queues[language] = queue
+            while len(queue['words']) < size and not queue['exhausted']:
+                words, cursor = self.model.get_due_words(
+                    language, limit=max(self.prefetch, size), cursor=queue['cursor'], now=queue['now']
+                )
+                queue['words'].extend(words)
+                queue['cursor'] = cursor
+                queue['exhausted'] = cursor is None
+            return list(queue['words'][:size])
+
+    def invalidate(self, language):
+        with self._lock:
+            self._queues.pop(language, None)
@@ -0,0 +1,45 @@
+import fcntl
+import multiprocessing
+import os
+import tempfile
+
+# Cloud Run and similar platforms pass the port to listen on in PORT
+bind = f"0.0.0.0:{os.getenv('PORT', '8080')}"
+
+# Processes for CPU-bound cropping, threads to overlap Vision/DeepL/Datastore calls.
+# Upload jobs are kept in Datastore in production, so any worker can report
+# them; set JOB_STORE_BACKEND=datastore when running more than one locally
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+threads = int(os.getenv('GUNICORN_THREADS', '8'))
+worker_class = 'gthread'
+
+# Requests include a Vision call plus cropping; SSE job streams stay open longer
+timeout = int(os.getenv('GUNICORN_TIMEOUT', '120'))
+graceful_timeout = 30
+keepalive = 5
+
+# With preloading the app is imported once in the master and forked; the
+# shared clients are created lazily per worker, so this only saves import time
+preload_app = os.getenv('GUNICORN_PRELOAD', '1').lower() in ('1', 'true', 'yes')
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('LOG_LEVEL', 'info').lower()
+
+# Held by the one worker that runs the background tasks; the lock is released
+# when that worker exits, so the worker replacing it takes over
+background_lock_path = os.getenv(
+    'BACKGROUND_LOCK_PATH', os.path.join(tempfile.gettempdir(), f"language-learning-{os.getenv('PORT', '8080')}.lock"))
+
+def post_worker_init(worker):
+    # Background threads start in a worker, never in the preloading master
+    lock_file = open(background_lock_path, 'w')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock_file.close()
+        return
+    # Kept open for the life of the worker
+    worker.background_lock_file = lock_file
+    from app import start_background_tasks
+    start_background_tasks()
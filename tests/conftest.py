@@ -0,0 +1,6 @@
+import os
+import sys
+
+# Tests run against the in-process model backend; no Google services needed
+os.environ.setdefault('MODEL_BACKEND', 'memory')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
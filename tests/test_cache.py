@@ -0,0 +1,101 @@
+import time
+from collections import namedtuple
+
+import pytest
+
+from utils.cache_utils import DatastoreStore, SQLiteStore
+from utils.translate_utils import create_translation_store
+from utils.vision_utils import create_detection_cache
+
+
+def test_translation_store_defaults_to_datastore_in_production(monkeypatch):
+    monkeypatch.delenv('TRANSLATION_CACHE_BACKEND', raising=False)
+    monkeypatch.setenv('MODEL_BACKEND', 'datastore')
+    assert isinstance(create_translation_store(datastore_client=object()), DatastoreStore)
+
+
+def test_translation_store_defaults_to_sqlite_locally(monkeypatch, tmp_path):
+    monkeypatch.delenv('TRANSLATION_CACHE_BACKEND', raising=False)
+    monkeypatch.setenv('TRANSLATION_CACHE_PATH', str(tmp_path / 'translations.sqlite3'))
+    assert isinstance(create_translation_store(), SQLiteStore)
+    monkeypatch.setenv('MODEL_BACKEND', 'datastore')
+    monkeypatch.setenv('TRANSLATION_CACHE_BACKEND', 'sqlite')
+    assert isinstance(create_translation_store(), SQLiteStore)
+    monkeypatch.setenv('TRANSLATION_CACHE_BACKEND', 'none')
+    assert create_translation_store() is None
+
+
+def test_sqlite_store_ignores_expired_entries(tmp_path, monkeypatch):
+    store = SQLiteStore(str(tmp_path / 'cache.sqlite3'), ttl=60)
+    store.set_many({'a': 1})
+    assert store.get_many(['a', 'b']) == {'a': 1}
+    monkeypatch.setattr('utils.cache_utils.time.time', lambda: 10 ** 12)
+    assert store.get_many(['a']) == {}
+
+
+def test_detection_cache_defaults_to_bounded_datastore_in_production(monkeypatch):
+    monkeypatch.delenv('VISION_CACHE_BACKEND', raising=False)
+    monkeypatch.setenv('MODEL_BACKEND', 'datastore')
+    store = create_detection_cache(datastore_client=object()).store
+    assert isinstance(store, DatastoreStore)
+    assert store.ttl == 7 * 24 * 60 * 60
+
+
+def test_detection_cache_sqlite_tier_has_ttl_and_cap(monkeypatch, tmp_path):
+    monkeypatch.delenv('VISION_CACHE_BACKEND', raising=False)
+    monkeypatch.setenv('VISION_CACHE_PATH', str(tmp_path / 'vision.sqlite3'))
+    monkeypatch.setenv('VISION_CACHE_TTL', '60')
+    store = create_detection_cache(max_entries=5).store
+    assert isinstance(store, SQLiteStore)
+    assert (store.ttl, store.max_entries) == (60, 5)
+
+
+FakeKey = namedtuple('FakeKey', ['kind', 'name'])
+
+
+class FakeEntity(dict):
+    def __init__(self, key, **properties):
+        super().__init__(properties)
+        self.key = key
+
+
+class FakeDatastoreClient:
+    def __init__(self, entities=()):
+        self.entities = {entity.key.name: entity for entity in entities}
+
+    def key(self, kind, name):
+        return FakeKey(kind, name)
+
+    def get_multi(self, keys):
+        return [self.entities[key.name] for key in keys if key.name in self.entities]
+
+    def put_multi(self, entities):
+        self.entities.update((entity.key.name, entity) for entity in entities)
+
+
+def test_datastore_store_ignores_expired_entities():
+    client = FakeDatastoreClient([
+        FakeEntity(FakeKey('VisionCache', 'fresh'), value='1', updated_at=time.time()),
+        FakeEntity(FakeKey('VisionCache', 'stale'), value='2', updated_at=time.time() - 120),
+    ])
+    store = DatastoreStore(client, kind='VisionCache', ttl=60)
+    assert store.get_many(['fresh', 'stale', 'missing']) == {'fresh': 1}
+
+
+def test_datastore_store_sets_expires_at_for_ttl_policy():
+    pytest.importorskip('google.cloud.datastore')
+    client = FakeDatastoreClient()
+    DatastoreStore(client, kind='VisionCache', ttl=60).set_many({'a': [1]})
+    entity = client.entities['a']
+    assert 'expires_at' in entity.exclude_from_indexes
+    assert entity['expires_at'].timestamp() == pytest.approx(time.time() + 60, abs=5)
+
+
+def test_translation_cache_warm_up_opens_session_and_store(tmp_path):
+    from utils.translate_utils import TranslationCache, TranslationClient
+    client = TranslationClient('key', api_url='http://deepl.invalid')
+    store = SQLiteStore(str(tmp_path / 'translations.sqlite3'))
+    cache = TranslationCache(client, store=store)
+    assert not client._session.created and not store._connection.created
+    cache.warm_up()
+    assert client._session.created and store._connection.created
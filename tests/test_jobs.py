@@ -0,0 +1,96 @@
+import threading
+import time
+from collections import namedtuple
+
+import pytest
+
+from utils.job_utils import (
+    DONE, FAILED, DatastoreJobStore, InMemoryJobStore, JobQueueFull, JobRunner, create_job_store
+)
+
+
+def wait_for(store, job_id, status):
+    deadline = time.monotonic() + 5
+    while store.get(job_id)['status'] != status:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    return store.get(job_id)
+
+
+def test_runner_records_objects_and_completion():
+    runner = JobRunner(InMemoryJobStore(), max_workers=2)
+
+    def job(job_id, names):
+        for name in names:
+            runner.store.update(job_id, new_object={'name': name})
+
+    job_id = runner.submit(job, ['Cat', 'Dog'])
+    assert wait_for(runner.store, job_id, DONE)['objects'] == [{'name': 'Cat'}, {'name': 'Dog'}]
+
+
+def test_runner_records_failures():
+    runner = JobRunner(InMemoryJobStore())
+
+    def job(job_id):
+        raise RuntimeError('Vision is down')
+
+    job_id = runner.submit(job)
+    assert wait_for(runner.store, job_id, FAILED)['error'] == 'Vision is down'
+
+
+def test_runner_sheds_load_past_max_pending():
+    release = threading.Event()
+    runner = JobRunner(InMemoryJobStore(), max_workers=1, max_pending=1)
+    runner.submit(lambda job_id: release.wait(5))
+    with pytest.raises(JobQueueFull):
+        runner.submit(lambda job_id: None)
+    release.set()
+
+
+def test_wait_returns_when_an_object_arrives():
+    store = InMemoryJobStore()
+    store.create('job')
+    threading.Timer(0.05, store.update, args=('job',), kwargs={'new_object': {'name': 'Cat'}}).start()
+    assert store.wait('job', 0, timeout=5)['objects'] == [{'name': 'Cat'}]
+
+
+def test_job_store_defaults(monkeypatch):
+    monkeypatch.delenv('JOB_STORE_BACKEND', raising=False)
+    assert isinstance(create_job_store(), InMemoryJobStore)
+    monkeypatch.setenv('MODEL_BACKEND', 'datastore')
+    assert isinstance(create_job_store(datastore_client=object()), DatastoreJobStore)
+
+
+FakeKey = namedtuple('FakeKey', ['kind', 'name'])
+
+
+class FakeDatastoreClient:
+    def __init__(self):
+        self.entities = {}
+        self.puts = 0
+
+    def key(self, kind, name):
+        return FakeKey(kind, name)
+
+    def get(self, key):
+        return self.entities.get(key.name)
+
+    def put(self, entity):
+        self.puts += 1
+        self.entities[entity.key.name] = entity
+
+
+def test_datastore_job_store_is_readable_from_another_store():
+    pytest.importorskip('google.cloud.datastore')
+    client = FakeDatastoreClient()
+    owner = DatastoreJobStore(client, poll_interval=0.01)
+    # Stands in for another worker process sharing the same Datastore
+    other = DatastoreJobStore(client, poll_interval=0.01)
+    owner.create('job')
+    other.update('job', status=DONE)
+    owner.update('job', new_object={'name': 'Cat'})
+    assert other.get('job') == {'status': 'pending', 'objects': [{'name': 'Cat'}], 'error': None}
+    assert other.wait('job', 1, timeout=0.05)['objects'] == [{'name': 'Cat'}]
+    owner.update('job', status=DONE)
+    assert other.wait('job', 1, timeout=5)['status'] == DONE
+    assert other.get('missing') is None
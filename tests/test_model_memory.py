@@ -0,0 +1,161 @@
+from collections import namedtuple
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from gbmodel import Model, model_backend
+from gbmodel import model_datastore
+from gbmodel.scheduler import MAX_INTERVAL_DAYS
+
+
+def missed(word, translation, language='DE'):
+    return {'language': language, 'image_path': f'{word}.jpg', 'english_word': word, 'translation': translation}
+
+
+@pytest.fixture
+def model():
+    assert model_backend == 'memory'
+    model = Model('test-project')
+    model.add_missed_words([missed('Cat', 'Katze'), missed('Dog', 'Hund'), missed('Car', 'Auto')])
+    return model
+
+
+def ids_of(model, language='DE'):
+    return {word['key'].id: word for word in model.get_missed_words(language, limit=10)}
+
+
+def test_add_missed_words_skips_missing_image_path(model):
+    model.add_missed_words([missed('Chair', 'Stuhl'), dict(missed('Table', 'Tisch'), image_path='')])
+    words = [word['english_word'] for word in model.get_missed_words('DE', limit=10)]
+    assert sorted(words) == ['Car', 'Cat', 'Chair', 'Dog']
+
+
+def test_grade_reviews_checks_guesses_case_insensitively(model):
+    ids = {word['english_word']: key for key, word in ids_of(model).items()}
+    results = model.grade_reviews([ids['Cat'], ids['Dog']], ['katze', 'Katze'])
+    assert [(r['english_word'], r['correct'], r['language']) for r in results] == [('Cat', True, 'DE'), ('Dog', False, 'DE')]
+
+
+def test_grade_reviews_skips_unknown_ids(model):
+    ids = {word['english_word']: key for key, word in ids_of(model).items()}
+    results = model.grade_reviews([999, ids['Car'], '1000'], ['x', 'Auto', 'y'])
+    assert [r['english_word'] for r in results] == ['Car']
+
+
+def test_grade_reviews_handles_duplicate_ids(model):
+    ids = {word['english_word']: key for key, word in ids_of(model).items()}
+    results = model.grade_reviews([ids['Cat'], str(ids['Cat'])], ['Katze', 'Katze'])
+    assert [r['correct'] for r in results] == [True, True]
+    # The first grade makes the word not due, so the repeat doesn't reschedule it again
+    assert model._entities[ids['Cat']]['correct_guesses'] == 1
+    assert model._entities[ids['Cat']]['repetitions'] == 1
+
+
+def test_grade_reviews_ignores_resubmitted_reviews(model):
+    ids = {word['english_word']: key for key, word in ids_of(model).items()}
+    model.grade_reviews([ids['Cat'], ids['Dog']], ['Katze', 'wrong'])
+    before = {key: dict(model._entities[key]) for key in (ids['Cat'], ids['Dog'])}
+    results = model.grade_reviews([ids['Cat'], ids['Dog']], ['Katze', 'Hund'])
+    assert [r['correct'] for r in results] == [True, True]
+    assert {key: model._entities[key] for key in before} == before
+
+
+def test_grade_reviews_deletes_learned_words(model):
+    ids = {word['english_word']: key for key, word in ids_of(model).items()}
+    model._entities[ids['Cat']].update(interval=MAX_INTERVAL_DAYS, repetitions=5)
+    model.grade_reviews([ids['Cat']], ['Katze'])
+    assert ids['Cat'] not in model._entities
+    assert 'Cat.jpg' not in model.get_referenced_image_paths()
+
+
+# model_datastore.grade_reviews against a minimal stand-in for datastore.Client
+
+FakeKey = namedtuple('FakeKey', ['kind', 'id'])
+
+
+class FakeEntity(dict):
+    def __init__(self, key, **properties):
+        super().__init__(properties)
+        self.key = key
+        self.exclude_from_indexes = set()
+
+
+class FakeClient:
+    def __init__(self, entities):
+        self.entities = {entity.key.id: entity for entity in entities}
+        self.calls = []
+
+    def key(self, kind, id):
+        return FakeKey(kind, id)
+
+    def transaction(self):
+        return nullcontext()
+
+    def query(self, kind):
+        return SimpleNamespace(fetch=lambda: iter(list(self.entities.values())))
+
+    def get_multi(self, keys):
+        self.calls.append(('get_multi', [key.id for key in keys]))
+        return [self.entities[key.id] for key in set(keys) if key.id in self.entities]
+
+    def put_multi(self, entities):
+        self.calls.append(('put_multi', sorted(entity.key.id for entity in entities)))
+
+    def delete_multi(self, keys):
+        self.calls.append(('delete_multi', sorted(key.id for key in keys)))
+
+
+def fake_word(id, translation, **schedule):
+    return FakeEntity(FakeKey('MissedWord', id), language='DE', english_word=f'word{id}',
+                      translation=translation, correct_guesses=0, **schedule)
+
+
+def test_datastore_grade_reviews_batches_rpcs():
+    client = FakeClient([
+        fake_word(1, 'Katze'),
+        fake_word(2, 'Hund', interval=MAX_INTERVAL_DAYS, repetitions=5, ease=2.5),
+        fake_word(3, 'Auto'),
+    ])
+    model = model_datastore.Model('test-project', client=client)
+    results = model.grade_reviews([1, 1, 2, 3, 42], ['Katze', 'Katze', 'Hund', 'nope', 'x'])
+
+    assert [r['english_word'] for r in results] == ['word1', 'word1', 'word2', 'word3']
+    # One read, then each word written once; the learned word is deleted rather than put
+    assert client.calls == [
+        ('get_multi', [1, 1, 2, 3, 42]),
+        ('put_multi', [1, 3]),
+        ('delete_multi', [2]),
+    ]
+    assert client.entities[1]['correct_guesses'] == 1
+    assert client.entities[1]['repetitions'] == 1
+
+
+def test_datastore_grade_reviews_skips_words_not_due():
+    client = FakeClient([fake_word(1, 'Katze', due_at=datetime.now() + timedelta(days=1), interval=1,
+                                   repetitions=1, ease=2.5)])
+    model = model_datastore.Model('test-project', client=client)
+    results = model.grade_reviews([1], ['Katze'])
+    assert [r['correct'] for r in results] == [True]
+    assert client.calls == [('get_multi', [1])]
+    assert client.entities[1]['repetitions'] == 1
+
+
+def test_datastore_backfill_schedules_old_words_only():
+    scheduled_at = datetime(2024, 1, 1)
+    client = FakeClient([
+        fake_word(1, 'Katze', timestamp=scheduled_at),
+        fake_word(2, 'Hund', due_at=scheduled_at, interval=6, repetitions=2, ease=2.5),
+        fake_word(3, 'Auto'),
+    ])
+    model = model_datastore.Model('test-project', client=client)
+    assert model.backfill_schedule(batch_size=1) == 2
+
+    assert client.calls == [('put_multi', [1]), ('put_multi', [3])]
+    assert client.entities[1]['due_at'] == scheduled_at
+    assert client.entities[1]['repetitions'] == 0
+    assert client.entities[2]['interval'] == 6
+    assert client.entities[3]['due_at'] is not None
+    # Scheduling fields are never filtered on, same as add_missed_words
+    assert client.entities[1].exclude_from_indexes == set(model_datastore.UNINDEXED_PROPERTIES)
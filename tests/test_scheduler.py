@@ -0,0 +1,99 @@
+from datetime import datetime, timedelta
+
+from gbmodel import Model
+from gbmodel.scheduler import (
+    DEFAULT_EASE, MAX_INTERVAL_DAYS, RETRY_DELAY, ReviewQueues, initial_schedule, is_learned, schedule_review
+)
+
+NOW = datetime(2024, 1, 1, 12, 0)
+
+
+def test_correct_answers_grow_the_interval():
+    word = initial_schedule(NOW)
+    intervals = []
+    for _ in range(4):
+        word = schedule_review(word, True, NOW)
+        intervals.append(word['interval'])
+    assert intervals[:2] == [1, 6]
+    # A correct answer (quality 4) leaves the ease unchanged
+    assert word['ease'] == DEFAULT_EASE
+    assert intervals[2:] == [round(6 * DEFAULT_EASE), round(round(6 * DEFAULT_EASE) * DEFAULT_EASE)]
+    assert word['repetitions'] == 4
+    assert word['due_at'] == NOW + timedelta(days=intervals[-1])
+
+
+def test_wrong_answer_resets_the_word():
+    word = {'ease': DEFAULT_EASE, 'interval': 15, 'repetitions': 3, 'due_at': NOW}
+    schedule = schedule_review(word, False, NOW)
+    assert schedule['interval'] == 0
+    assert schedule['repetitions'] == 0
+    assert schedule['ease'] < DEFAULT_EASE
+    assert schedule['due_at'] == NOW + RETRY_DELAY
+
+
+def test_words_without_schedule_are_treated_as_new():
+    assert schedule_review({'translation': 'Katze'}, True, NOW)['interval'] == 1
+
+
+def test_word_is_retired_after_max_interval():
+    word = initial_schedule(NOW)
+    while not is_learned(word):
+        assert word['interval'] <= MAX_INTERVAL_DAYS
+        word = schedule_review(word, True, NOW)
+    assert word['interval'] > MAX_INTERVAL_DAYS
+
+
+class CountingModel(Model):
+    def __init__(self):
+        super().__init__('test-project')
+        self.queries = 0
+        self.queues = None
+        self.lock_held_during_query = False
+
+    def get_due_words(self, language, limit=5, cursor=None, now=None):
+        self.queries += 1
+        if self.queues is not None and self.queues._lock.locked():
+            self.lock_held_during_query = True
+        return super().get_due_words(language, limit=limit, cursor=cursor, now=now)
+
+
+def make_queues(count, prefetch=50):
+    model = CountingModel()
+    model.add_missed_words([
+        {'language': 'DE', 'image_path': f'{i}.jpg', 'english_word': f'word{i}', 'translation': f'Wort{i}'}
+        for i in range(count)
+    ])
+    queues = ReviewQueues(model, prefetch=prefetch)
+    model.queues = queues
+    return model, queues
+
+
+def english_words(batch):
+    return [word['english_word'] for word in batch]
+
+
+def test_next_batch_returns_same_words_until_graded():
+    model, queues = make_queues(8)
+    first = queues.next_batch('DE')
+    # Reloading the review page before answering shows the same words again
+    assert english_words(queues.next_batch('DE')) == english_words(first)
+    assert len(first) == 5
+    assert model.queries == 1
+    assert not model.lock_held_during_query
+
+    model.grade_reviews([word['key'].id for word in first], [word['translation'] for word in first])
+    queues.invalidate('DE')
+    remaining = english_words(queues.next_batch('DE'))
+    assert len(remaining) == 3
+    assert not set(remaining) & set(english_words(first))
+
+
+def test_next_batch_pages_through_the_model():
+    model, queues = make_queues(7, prefetch=3)
+    assert len(queues.next_batch('DE', size=2)) == 2
+    assert len(queues.next_batch('DE', size=3)) == 3
+    assert model.queries == 1
+    # A bigger batch than the queue holds fetches the next pages
+    assert len(queues.next_batch('DE', size=10)) == 7
+    assert model.queries == 2
+    assert queues.next_batch('FR') == []
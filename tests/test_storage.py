@@ -0,0 +1,78 @@
+import os
+import time
+
+import pytest
+
+from gbmodel import Model
+from utils.storage_utils import CropReaper, LocalStorage, crop_name_for
+
+DAY = 24 * 60 * 60
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return LocalStorage(str(tmp_path / 'extracted'))
+
+
+def save_aged(storage, name, age):
+    storage.save(name, name.encode())
+    modified_at = time.time() - age
+    os.utime(os.path.join(storage.directory, name), (modified_at, modified_at))
+
+
+def stored(storage):
+    return sorted(name for name, _ in storage.list())
+
+
+def make_model(*image_paths):
+    model = Model('test-project')
+    model.add_missed_words([
+        {'language': 'DE', 'image_path': path, 'english_word': 'Cat', 'translation': 'Katze'} for path in image_paths
+    ])
+    return model
+
+
+def test_crop_name_for_maps_thumbnails_to_their_crop():
+    assert crop_name_for('abc_thumb.jpg') == 'abc.jpg'
+    assert crop_name_for('abc.webp') == 'abc.webp'
+
+
+def test_reaper_deletes_old_unreferenced_crops_and_thumbnails(storage):
+    for name in ('old.jpg', 'old_thumb.jpg', 'kept.jpg', 'kept_thumb.jpg'):
+        save_aged(storage, name, 2 * DAY)
+    reaper = CropReaper(storage, make_model('extracted/kept.jpg'), grace_period=DAY)
+    assert reaper.reap() == 2
+    assert stored(storage) == ['kept.jpg', 'kept_thumb.jpg']
+
+
+def test_reaper_keeps_crops_within_grace_period(storage):
+    save_aged(storage, 'new.jpg', DAY / 2)
+    save_aged(storage, 'new_thumb.jpg', DAY / 2)
+    assert CropReaper(storage, make_model(), grace_period=DAY).reap() == 0
+    assert stored(storage) == ['new.jpg', 'new_thumb.jpg']
+
+
+class ConcurrentUploadStorage(LocalStorage):
+    """Saves the same crop again right after the reaper took its listing."""
+
+    def list(self):
+        entries = list(super().list())
+        self.save('busy.jpg', b'busy.jpg')
+        return iter(entries)
+
+
+def test_reaper_keeps_crops_saved_again_during_reap(tmp_path):
+    storage = ConcurrentUploadStorage(str(tmp_path / 'extracted'))
+    save_aged(storage, 'busy.jpg', 2 * DAY)
+    save_aged(storage, 'idle.jpg', 2 * DAY)
+    assert CropReaper(storage, make_model(), grace_period=DAY).reap() == 1
+    assert stored(storage) == ['busy.jpg']
+
+
+def test_save_after_reaper_took_the_file_stores_it_again(storage):
+    save_aged(storage, 'crop.jpg', 2 * DAY)
+    assert storage.delete_if_older('crop.jpg', time.time() - DAY)
+    assert not storage.delete_if_older('crop.jpg', time.time() - DAY)
+    storage.save('crop.jpg', b'crop.jpg')
+    assert stored(storage) == ['crop.jpg']
+    assert not storage.delete_if_older('crop.jpg', time.time() - DAY)
@@ -0,0 +1,90 @@
+import logging
+
+import pytest
+import requests
+
+from utils import translate_utils
+from utils.translate_utils import TranslationClient
+
+
+class FakeResponse:
+    def __init__(self, status_code, texts=None, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self._texts = texts or []
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise requests.HTTPError(f"{self.status_code} error")
+
+    def json(self):
+        return {'translations': [{'text': text} for text in self._texts]}
+
+
+class FakeSession:
+    """Returns the queued responses in order, raising any queued exceptions."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = 0
+
+    def post(self, url, data=None, timeout=None):
+        self.calls += 1
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    delays = []
+    monkeypatch.setattr(translate_utils.time, 'sleep', delays.append)
+    return delays
+
+
+def make_client(responses, max_retries=3, backoff=0.5):
+    client = TranslationClient('key', api_url='http://deepl.invalid', max_retries=max_retries, backoff=backoff)
+    session = FakeSession(responses)
+    client._session.set(session)
+    return client, session
+
+
+def test_retries_server_errors_with_backoff(sleeps):
+    client, session = make_client([FakeResponse(503), FakeResponse(502), FakeResponse(200, ['Katze'])])
+    assert client.translate_batch(['Cat'], 'DE') == ['Katze']
+    assert session.calls == 3
+    assert len(sleeps) == 2
+    assert all(0 <= delay <= 0.5 * 2 ** attempt for attempt, delay in enumerate(sleeps))
+
+
+def test_honors_retry_after_within_cap(sleeps):
+    client, session = make_client([FakeResponse(429, headers={'Retry-After': '2'}), FakeResponse(200, ['Hund'])])
+    assert client.translate_batch(['Dog'], 'DE') == ['Hund']
+    assert sleeps == [2.0]
+
+
+def test_fails_fast_when_retry_after_exceeds_cap(sleeps, caplog):
+    client, session = make_client([FakeResponse(429, headers={'Retry-After': '120'}), FakeResponse(200, ['Hund'])])
+    with caplog.at_level(logging.WARNING), pytest.raises(ValueError):
+        client.translate_batch(['Dog'], 'DE')
+    assert session.calls == 1
+    assert sleeps == []
+    assert 'not retrying' in caplog.text
+    assert 'retrying in' not in caplog.text
+
+
+def test_gives_up_after_max_retries(sleeps):
+    client, session = make_client([FakeResponse(503)] * 3, max_retries=2)
+    with pytest.raises(ValueError):
+        client.translate_batch(['Cat'], 'DE')
+    assert session.calls == 3
+    assert len(sleeps) == 2
+
+
+def test_connection_errors_are_retried_then_raised(sleeps):
+    client, session = make_client([requests.ConnectionError('reset')] * 2, max_retries=1)
+    with pytest.raises(ValueError, match='Translation request failed'):
+        client.translate_batch(['Cat'], 'DE')
+    assert session.calls == 2
+    assert len(sleeps) == 1
@@ -0,0 +1,32 @@
+import io
+
+import pytest
+from PIL import Image
+
+from utils.vision_utils import MAX_DECODE_SIZE, _open_for_cropping
+
+
+def encoded(size, image_format='JPEG'):
+    buffer = io.BytesIO()
+    Image.linear_gradient('L').resize(size).convert('RGB').save(buffer, image_format)
+    buffer.seek(0)
+    return buffer
+
+
+@pytest.mark.parametrize('size, expected', [
+    ((4032, 3024), (2016, 1512)),  # Typical phone photo: decoded at half scale
+    ((3000, 2000), (1500, 1000)),
+    ((5000, 3750), (1250, 938)),
+    ((2048, 1536), (2048, 1536)),
+    ((800, 600), (800, 600)),
+])
+def test_jpegs_are_decoded_within_max_size(size, expected):
+    image = _open_for_cropping(encoded(size), MAX_DECODE_SIZE)
+    assert image.size == expected
+    assert image.mode == 'RGB'
+
+
+def test_other_formats_are_reduced_within_max_size():
+    image = _open_for_cropping(encoded((4100, 1000), 'PNG'), MAX_DECODE_SIZE)
+    assert max(image.size) <= MAX_DECODE_SIZE
+    assert image.size == (1367, 334)
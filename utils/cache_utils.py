@@ -0,0 +1,200 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from utils.client_utils import LazyClient, resolve_client
+
+
+def default_store_backend():
+    """Persistent cache tier used when none is configured.
+
+    Datastore when the app's model is stored there, so cached entries survive
+    restarts and are shared by every instance; a local SQLite file otherwise.
+    """
+    return 'datastore' if os.getenv('MODEL_BACKEND', 'datastore') == 'datastore' else 'sqlite'
+
+
+class LRUCache:
+    """Thread-safe in-process LRU cache with an optional per-entry TTL."""
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class SQLiteStore:
+    """Persistent key/value store backed by a local SQLite file.
+
+    Values are stored as JSON. When max_entries is set, the least recently
+    written entries are evicted once the table grows past it. When ttl is
+    set, entries written more than ttl seconds ago are treated as missing.
+    """
+
+    def __init__(self, path, namespace='cache', max_entries=None, ttl=None):
+        self.path = path
+        self.table = namespace
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        # Opened on first use, and again in each forked worker
+        self._connection = LazyClient(self._connect)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, check_same_thread=False)
+        with conn:
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{self.table}" '
+                '(key TEXT PRIMARY KEY, value TEXT NOT NULL, updated_at REAL NOT NULL)'
+            )
+        return conn
+
+    @property
+    def _conn(self):
+        return self._connection.get()
+
+    def warm_up(self):
+        """Open this process's connection ahead of the first lookup."""
+        self._connection.get()
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        placeholders = ','.join('?' * len(keys))
+        oldest = time.time() - self.ttl if self.ttl else 0
+        with self._lock:
+            rows = self._conn.execute(
+                f'SELECT key, value FROM "{self.table}" WHERE key IN ({placeholders}) AND updated_at >= ?',
+                keys + [oldest]
+            ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    def set_many(self, items):
+        if not items:
+            return
+        now = time.time()
+        rows = [(key, json.dumps(value), now) for key, value in items.items()]
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f'INSERT OR REPLACE INTO "{self.table}" (key, value, updated_at) VALUES (?, ?, ?)', rows
+            )
+            if self.max_entries:
+                self._conn.execute(
+                    f'DELETE FROM "{self.table}" WHERE key NOT IN '
+                    f'(SELECT key FROM "{self.table}" ORDER BY updated_at DESC LIMIT ?)',
+                    (self.max_entries,)
+                )
+
+
+class DatastoreStore:
+    """Persistent key/value store backed by Cloud Datastore entities.
+
+    Each value is kept as JSON on an entity of the given kind, keyed by name,
+    so lookups and writes are single get_multi/put_multi round-trips. When
+    ttl is set, entities written more than ttl seconds ago are ignored, and
+    each one carries an expires_at timestamp so a TTL policy deletes them:
+
+        gcloud firestore fields ttls update expires_at --collection-group=<kind> --enable-ttl
+    """
+
+    def __init__(self, client, kind='CacheEntry', ttl=None):
+        # May be a LazyClient so building the store doesn't create the client
+        self._client = client
+        self.kind = kind
+        self.ttl = ttl
+
+    @property
+    def client(self):
+        return resolve_client(self._client)
+
+    def warm_up(self):
+        """Create this process's Datastore client ahead of the first lookup."""
+        resolve_client(self._client)
+
+    def get_many(self, keys):
+        keys = list(keys)
+        if not keys:
+            return {}
+        entities = self.client.get_multi([self.client.key(self.kind, key) for key in keys])
+        oldest = time.time() - self.ttl if self.ttl else 0
+        return {entity.key.name: json.loads(entity['value']) for entity in entities
+                if entity.get('updated_at', 0) >= oldest}
+
+    def set_many(self, items):
+        if not items:
+            return
+        from google.cloud import datastore
+        entities = []
+        for key, value in items.items():
+            entity = datastore.Entity(key=self.client.key(self.kind, key), exclude_from_indexes=('value', 'expires_at'))
+            entity.update({'value': json.dumps(value), 'updated_at': time.time()})
+            if self.ttl:
+                entity['expires_at'] = datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+            entities.append(entity)
+        self.client.put_multi(entities)
+
+
+class TieredCache:
+    """In-process LRU in front of a shared persistent store.
+
+    Reads check memory first, then the store; store hits are promoted into
+    memory. Writes go to both tiers.
+    """
+
+    def __init__(self, memory, store=None):
+        self.memory = memory
+        self.store = store
+
+    def warm_up(self):
+        if self.store is not None:
+            self.store.warm_up()
+
+    def get_many(self, keys):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self.memory.get(key)
+            if value is None:
+                missing.append(key)
+            else:
+                found[key] = value
+        if missing and self.store is not None:
+            stored = self.store.get_many(missing)
+            for key, value in stored.items():
+                self.memory.set(key, value)
+            found.update(stored)
+        return found
+
+    def set_many(self, items):
+        for key, value in items.items():
+            self.memory.set(key, value)
+        if self.store is not None:
+            self.store.set_many(items)
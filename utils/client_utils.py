@@ -0,0 +1,44 @@
+import os
+import threading
+
+
+class LazyClient:
+    """Creates a shared client (or other per-process resource) on first use.
+
+    gRPC channels, HTTP connection pools, SQLite connections and thread pools
+    don't survive a fork, so the instance is remembered together with the pid
+    that built it and rebuilt when used from a forked worker. This lets the
+    app be imported in a pre-forking server's master without workers
+    inheriting broken resources.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._instance = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        if self._instance is None or self._pid != os.getpid():
+            with self._lock:
+                if self._instance is None or self._pid != os.getpid():
+                    self._instance = self.factory()
+                    self._pid = os.getpid()
+        return self._instance
+
+    def set(self, instance):
+        """Pin an existing instance, e.g. a stub in benchmarks; it is not rebuilt after a fork."""
+        with self._lock:
+            self._instance = instance
+            self._pid = None if instance is None else os.getpid()
+            if instance is not None:
+                self.factory = lambda: instance
+
+    @property
+    def created(self):
+        return self._instance is not None and self._pid == os.getpid()
+
+
+def resolve_client(client):
+    """Return the real client whether given a client or a LazyClient wrapping one."""
+    return client.get() if isinstance(client, LazyClient) else client
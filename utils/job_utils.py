@@ -0,0 +1,203 @@
+import json
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from utils.client_utils import LazyClient, resolve_client
+from utils.cache_utils import default_store_backend
+
+PENDING = 'pending'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class JobQueueFull(Exception):
+    """Raised when the runner already has as many jobs as it accepts."""
+
+
+class InMemoryJobStore:
+    """Keeps job state in this process, with waiters notified on every change.
+
+    Only suitable when the polling request reaches the process that ran the
+    job, i.e. a single worker; use DatastoreJobStore otherwise.
+    """
+
+    def __init__(self, ttl=15 * 60):
+        self.ttl = ttl
+        self._jobs = {}
+        self._changed = threading.Condition()
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items() if job['updated_at'] < cutoff]:
+            del self._jobs[job_id]
+
+    def create(self, job_id):
+        with self._changed:
+            self._expire()
+            self._jobs[job_id] = {'status': PENDING, 'objects': [], 'error': None, 'updated_at': time.time()}
+
+    def update(self, job_id, status=None, error=None, new_object=None):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if status is not None:
+                job['status'] = status
+            if error is not None:
+                job['error'] = error
+            if new_object is not None:
+                job['objects'].append(new_object)
+            job['updated_at'] = time.time()
+            self._changed.notify_all()
+
+    def get(self, job_id):
+        with self._changed:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            return {'status': job['status'], 'objects': list(job['objects']), 'error': job['error']}
+
+    def wait(self, job_id, seen_objects, timeout):
+        """Block until the job has more than seen_objects objects or has finished."""
+        def ready():
+            job = self._jobs.get(job_id)
+            return job is None or len(job['objects']) > seen_objects or job['status'] in (DONE, FAILED)
+
+        with self._changed:
+            self._changed.wait_for(ready, timeout=timeout)
+        return self.get(job_id)
+
+
+class DatastoreJobStore:
+    """Keeps job state on Datastore entities so any worker or instance can report it.
+
+    Only the process that created a job updates it, so updates are written
+    from a local copy without a read or a transaction. Waiters poll every
+    poll_interval seconds. Jobs older than ttl are treated as gone, and
+    carry an expires_at timestamp so a TTL policy on the kind deletes them.
+    """
+
+    def __init__(self, client, kind='UploadJob', ttl=15 * 60, poll_interval=0.5):
+        # May be a LazyClient so building the store doesn't create the client
+        self._client = client
+        self.kind = kind
+        self.ttl = ttl
+        self.poll_interval = poll_interval
+        self._owned = {}
+        self._lock = threading.Lock()
+
+    @property
+    def client(self):
+        return resolve_client(self._client)
+
+    def _put(self, job_id, job):
+        from google.cloud import datastore
+        # Jobs are only ever fetched by key, so nothing needs indexing
+        entity = datastore.Entity(key=self.client.key(self.kind, job_id),
+                                  exclude_from_indexes=('status', 'objects', 'error', 'updated_at', 'expires_at'))
+        entity.update({
+            'status': job['status'],
+            'objects': json.dumps(job['objects']),
+            'error': job['error'],
+            'updated_at': time.time(),
+            'expires_at': datetime.now(timezone.utc) + timedelta(seconds=self.ttl)
+        })
+        self.client.put(entity)
+
+    def create(self, job_id):
+        job = {'status': PENDING, 'objects': [], 'error': None}
+        with self._lock:
+            self._owned[job_id] = (threading.Lock(), job)
+        self._put(job_id, job)
+
+    def update(self, job_id, status=None, error=None, new_object=None):
+        with self._lock:
+            owned = self._owned.get(job_id)
+        if owned is None:
+            return
+        lock, job = owned
+        # Crops publish from several threads; each write carries everything before it
+        with lock:
+            if status is not None:
+                job['status'] = status
+            if error is not None:
+                job['error'] = error
+            if new_object is not None:
+                job['objects'].append(new_object)
+            self._put(job_id, job)
+        if job['status'] in (DONE, FAILED):
+            with self._lock:
+                self._owned.pop(job_id, None)
+
+    def get(self, job_id):
+        entity = self.client.get(self.client.key(self.kind, job_id))
+        if entity is None or entity.get('updated_at', 0) < time.time() - self.ttl:
+            return None
+        return {'status': entity['status'], 'objects': json.loads(entity['objects']), 'error': entity.get('error')}
+
+    def wait(self, job_id, seen_objects, timeout):
+        """Poll until the job has more than seen_objects objects or has finished."""
+        deadline = time.monotonic() + timeout
+        while True:
+            job = self.get(job_id)
+            if job is None or len(job['objects']) > seen_objects or job['status'] in (DONE, FAILED):
+                return job
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return job
+            time.sleep(min(self.poll_interval, remaining))
+
+
+def create_job_store(backend=None, datastore_client=None):
+    """Build the job store selected by JOB_STORE_BACKEND ('datastore' or 'memory').
+
+    Defaults to Datastore in production (MODEL_BACKEND=datastore), so a job
+    can be polled from any gunicorn worker or instance, and to memory otherwise.
+    """
+    backend = backend or os.getenv('JOB_STORE_BACKEND') or (
+        'datastore' if default_store_backend() == 'datastore' else 'memory')
+    if backend == 'datastore':
+        return DatastoreJobStore(datastore_client)
+    return InMemoryJobStore()
+
+
+class JobRunner:
+    """Runs jobs on a bounded thread pool and records their progress in a job store.
+
+    At most max_pending jobs may be queued or running at once; submit raises
+    JobQueueFull beyond that so callers can shed load instead of queueing.
+    """
+
+    def __init__(self, store, max_workers=4, max_pending=32):
+        self.store = store
+        self._executor = LazyClient(lambda: ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='job'))
+        self._slots = threading.BoundedSemaphore(max_pending)
+
+    def submit(self, fn, *args):
+        """Run fn(job_id, *args) in the background and return the new job id."""
+        if not self._slots.acquire(blocking=False):
+            raise JobQueueFull("Too many jobs in progress")
+        job_id = uuid.uuid4().hex
+        self.store.create(job_id)
+        try:
+            self._executor.get().submit(self._run, job_id, fn, args)
+        except Exception:
+            self._slots.release()
+            raise
+        return job_id
+
+    def _run(self, job_id, fn, args):
+        try:
+            self.store.update(job_id, status=RUNNING)
+            fn(job_id, *args)
+            self.store.update(job_id, status=DONE)
+        except Exception as e:
+            logging.error("Job %s failed: %s", job_id, e)
+            self.store.update(job_id, status=FAILED, error=str(e))
+        finally:
+            self._slots.release()
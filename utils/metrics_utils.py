@@ -0,0 +1,94 @@
+import bisect
+import threading
+import time
+from contextlib import ContextDecorator
+
+# Latency buckets in seconds, from a cache hit up to a slow Vision call
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_registry = []
+
+
+class Histogram:
+    """Minimal Prometheus-style histogram with labels."""
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(name, '')) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][index] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def _labels(self, key, extra=None):
+        pairs = list(zip(self.labelnames, key))
+        if extra:
+            pairs.append(extra)
+        if not pairs:
+            return ''
+        escaped = (value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+        return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {key: (list(s['counts']), s['sum'], s['count']) for key, s in self._series.items()}
+        for key, (counts, total, count) in sorted(series.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                le = '+Inf' if bound == float('inf') else repr(bound)
+                lines.append(f'{self.name}_bucket{self._labels(key, ("le", le))} {cumulative}')
+            lines.append(f'{self.name}_sum{self._labels(key)} {total}')
+            lines.append(f'{self.name}_count{self._labels(key)} {count}')
+        return '\n'.join(lines)
+
+
+REQUEST_SECONDS = Histogram(
+    'app_request_duration_seconds', 'Time spent handling HTTP requests.', ['endpoint', 'method', 'status']
+)
+STAGE_SECONDS = Histogram(
+    'app_stage_duration_seconds', 'Time spent in individual request stages and upstream calls.', ['stage']
+)
+
+
+class timed(ContextDecorator):
+    """Record the duration of a block or function call under a stage name."""
+
+    def __init__(self, stage, histogram=STAGE_SECONDS):
+        self.stage = stage
+        self.histogram = histogram
+        self._local = threading.local()
+
+    def __enter__(self):
+        # Per-thread start times so one instance can decorate a function used concurrently
+        starts = getattr(self._local, 'starts', None)
+        if starts is None:
+            starts = self._local.starts = []
+        starts.append(time.perf_counter())
+        return self
+
+    def __exit__(self, *exc_info):
+        elapsed = time.perf_counter() - self._local.starts.pop()
+        self.histogram.observe(elapsed, stage=self.stage)
+        return False
+
+
+def render_metrics():
+    """Render every registered metric in the Prometheus text exposition format."""
+    return '\n'.join(metric.render() for metric in _registry) + '\n'
+
+
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
@@ -0,0 +1,182 @@
+import os
+import time
+import logging
+import threading
+from utils.client_utils import LazyClient
+
+# Crops are named by content hash, so a given URL never changes
+IMMUTABLE_MAX_AGE = 365 * 24 * 60 * 60
+
+THUMBNAIL_SUFFIX = '_thumb'
+
+
+class LocalStorage:
+    """Stores crops as files in a local directory."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def save(self, name, data):
+        path = os.path.join(self.directory, name)
+        if os.path.exists(path):
+            try:
+                # Same content already stored; refresh it so the reaper's grace period restarts
+                os.utime(path)
+                return
+            except FileNotFoundError:
+                pass  # Taken by the reaper in the meantime; store it again
+        # Write then rename so a concurrent reader never sees a partial file
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def list(self):
+        """Yield (name, modified_time) for every stored crop."""
+        with os.scandir(self.directory) as entries:
+            for entry in entries:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    yield entry.name, entry.stat().st_mtime
+
+    def delete_if_older(self, name, cutoff):
+        """Delete a crop unless it was saved or touched at or after cutoff; return whether it was."""
+        path = os.path.join(self.directory, name)
+        # Move it aside first: a save from now on writes a fresh file instead of
+        # touching this one, so the modification time checked below is final
+        reaping = f'{path}.reap.tmp'
+        try:
+            os.replace(path, reaping)
+        except FileNotFoundError:
+            return False
+        if os.stat(reaping).st_mtime >= cutoff:
+            # Same name means same content, so replacing a copy saved meanwhile is harmless
+            os.replace(reaping, path)
+            return False
+        os.remove(reaping)
+        return True
+
+    def public_url(self, name):
+        # Served by the app itself
+        return None
+
+
+class GCSStorage:
+    """Stores crops in a Cloud Storage bucket so they can be served from a CDN."""
+
+    def __init__(self, bucket_name, prefix='extracted/', public_base_url=None):
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.public_base_url = public_base_url or f'https://storage.googleapis.com/{bucket_name}'
+        self._bucket = LazyClient(self._create_bucket)
+
+    def _create_bucket(self):
+        from google.cloud import storage
+        return storage.Client().bucket(self.bucket_name)
+
+    @property
+    def bucket(self):
+        return self._bucket.get()
+
+    def save(self, name, data):
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+        blob = self.bucket.blob(self.prefix + name)
+        blob.cache_control = f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+        try:
+            # Only create the object; a concurrent upload of the same crop can't overwrite it
+            blob.upload_from_string(data, content_type=_content_type(name), if_generation_match=0)
+            return
+        except PreconditionFailed:
+            pass
+        try:
+            # Same content already stored; touch it so the reaper's grace period restarts
+            blob.metadata = {'last_used': str(int(time.time()))}
+            blob.patch()
+        except NotFound:
+            # Reaped in the meantime; store it again
+            blob.upload_from_string(data, content_type=_content_type(name))
+
+    def list(self):
+        for blob in self.bucket.client.list_blobs(self.bucket, prefix=self.prefix):
+            yield blob.name[len(self.prefix):], blob.updated.timestamp()
+
+    def delete_if_older(self, name, cutoff):
+        """Delete a crop unless it was saved or touched at or after cutoff; return whether it was."""
+        from google.api_core.exceptions import NotFound, PreconditionFailed
+        blob = self.bucket.get_blob(self.prefix + name)
+        if blob is None or blob.updated.timestamp() >= cutoff:
+            return False
+        try:
+            # Touching a crop bumps its metageneration, so a save since get_blob fails this delete
+            blob.delete(if_generation_match=blob.generation, if_metageneration_match=blob.metageneration)
+        except (NotFound, PreconditionFailed):
+            return False
+        return True
+
+    def public_url(self, name):
+        return f'{self.public_base_url}/{self.prefix}{name}'
+
+
+def _content_type(name):
+    extension = name.rsplit('.', 1)[-1].lower()
+    return {'webp': 'image/webp', 'jpg': 'image/jpeg', 'png': 'image/png'}.get(extension, 'application/octet-stream')
+
+
+def create_crop_storage(local_directory, backend=None):
+    """Build the crop storage selected by CROP_STORAGE ('local' or 'gcs')."""
+    backend = backend or os.getenv('CROP_STORAGE', 'local')
+    if backend == 'gcs':
+        return GCSStorage(os.environ['CROP_BUCKET'], public_base_url=os.getenv('CROP_PUBLIC_BASE_URL'))
+    return LocalStorage(local_directory)
+
+
+def crop_name_for(name):
+    """Map a thumbnail filename to the crop it was made from."""
+    stem, dot, extension = name.rpartition('.')
+    if stem.endswith(THUMBNAIL_SUFFIX):
+        return f'{stem[:-len(THUMBNAIL_SUFFIX)]}{dot}{extension}'
+    return name
+
+
+class CropReaper:
+    """Background thread that deletes crops no missed word refers to anymore.
+
+    Crops younger than grace_period seconds are kept, since they may belong
+    to a quiz that has not been submitted yet.
+    """
+
+    def __init__(self, storage, model, interval=60 * 60, grace_period=24 * 60 * 60):
+        self.storage = storage
+        self.model = model
+        self.interval = interval
+        self.grace_period = grace_period
+        self._stop = threading.Event()
+        self._thread = None
+
+    def reap(self):
+        referenced = {os.path.basename(path) for path in self.model.get_referenced_image_paths()}
+        cutoff = time.time() - self.grace_period
+        deleted = 0
+        for name, modified_at in list(self.storage.list()):
+            # The listing is a snapshot; the storage checks the time again before deleting,
+            # in case the same crop was produced by an upload since
+            if modified_at < cutoff and crop_name_for(name) not in referenced:
+                if self.storage.delete_if_older(name, cutoff):
+                    deleted += 1
+        logging.info("Crop reaper deleted %s unreferenced crops", deleted)
+        return deleted
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.reap()
+            except Exception as e:
+                logging.error("Crop reaper failed: %s", e)
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name='crop-reaper', daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
@@ -1,4 +1,14 @@
+import asyncio
+import logging
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
 import requests
+from requests.adapters import HTTPAdapter
+from utils.metrics_utils import timed
+from utils.client_utils import LazyClient
+from utils.cache_utils import LRUCache, SQLiteStore, DatastoreStore, TieredCache, default_store_backend
 
 LANGUAGE_MAP = {
     "English": "EN",
@@ -22,29 +32,208 @@ LANGUAGE_MAP = {
     "Swedish": "SV"
 }
 
-def translate_text(text, target_lang, deepl_api_key):
-    url = "https://api-free.deepl.com/v2/translate"
-    
-    # Ensure the target language code is correct
-    target_lang = LANGUAGE_MAP.get(target_lang, target_lang)
-    
-    params = {
-        "auth_key": deepl_api_key,
-        "text": text,
-        "target_lang": target_lang
-    }
-    response = requests.post(url, data=params)
-    
-    # Log the raw response for debugging
-    print(f"DeepL API response: {response.text}")
-    
-    try:
-        result = response.json()
-        translation = result['translations'][0]['text']
-        return translation
-    except KeyError as e:
-        print(f"Error extracting translation: {e}")
-        raise ValueError("Translation response is invalid") from e
-    except Exception as e:
-        print(f"Unexpected error: {e}")
-        raise
+DEFAULT_DEEPL_API_URL = "https://api-free.deepl.com/v2/translate"
+
+# DeepL accepts at most 50 text parameters per request
+MAX_TEXTS_PER_REQUEST = 50
+
+RETRY_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TranslationClient:
+    """DeepL client with a pooled keep-alive session, timeouts and retries.
+
+    Texts for one language are sent as batched multi-text requests; when a
+    call needs several batches they are fanned out concurrently, bounded by
+    max_concurrency. Set DEEPL_API_URL to point the client at a local stub.
+    """
+
+    def __init__(self, deepl_api_key, api_url=None, timeout=(3.05, 10), max_retries=3,
+                 backoff=0.5, max_concurrency=4, pool_size=10):
+        self.deepl_api_key = deepl_api_key
+        self.api_url = api_url or os.getenv('DEEPL_API_URL', DEFAULT_DEEPL_API_URL)
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        # Built on first use and rebuilt in forked workers, which can't share sockets or threads
+        self._session = LazyClient(self._create_session)
+        self._executor = LazyClient(lambda: ThreadPoolExecutor(max_workers=max_concurrency))
+
+    def _create_session(self):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return session
+
+    @property
+    def session(self):
+        return self._session.get()
+
+    def warm_up(self):
+        """Create this process's pooled session ahead of the first request."""
+        self._session.get()
+
+    def _retry_delay(self, attempt, response=None):
+        """Seconds to wait before the next attempt, or None if the server asks for too long.
+
+        Waits are capped at backoff * 2 ** max_retries so a request thread is
+        never held much past a single backoff schedule.
+        """
+        max_delay = self.backoff * (2 ** self.max_retries)
+        retry_after = response.headers.get('Retry-After') if response is not None else None
+        if retry_after and retry_after.isdigit():
+            delay = float(retry_after)
+            return delay if delay <= max_delay else None
+        # Full jitter so concurrent workers don't retry in lockstep
+        return random.uniform(0, self.backoff * (2 ** attempt))
+
+    def _post(self, data):
+        for attempt in range(self.max_retries + 1):
+            response = None
+            error = None
+            try:
+                with timed('deepl_translate'):
+                    response = self.session.post(self.api_url, data=data, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.max_retries:
+                    raise ValueError(f"Translation request failed: {e}") from e
+                error = e
+            else:
+                if response.status_code not in RETRY_STATUS_CODES or attempt == self.max_retries:
+                    return response
+            delay = self._retry_delay(attempt, response)
+            if delay is None:
+                # Fail fast rather than block past the worker timeout
+                logging.warning("DeepL returned %s with Retry-After %ss, not retrying",
+                                response.status_code, response.headers.get('Retry-After'))
+                return response
+            if error is not None:
+                logging.warning("DeepL request failed (%s), retrying in %.2fs", error, delay)
+            else:
+                logging.warning("DeepL returned %s, retrying in %.2fs", response.status_code, delay)
+            time.sleep(delay)
+
+    def translate_batch(self, texts, target_lang):
+        """Translate up to MAX_TEXTS_PER_REQUEST texts with a single request."""
+        if not texts:
+            return []
+        target_lang = LANGUAGE_MAP.get(target_lang, target_lang)
+
+        # DeepL accepts the text parameter repeatedly and keeps the order
+        data = [("auth_key", self.deepl_api_key), ("target_lang", target_lang)]
+        data.extend(("text", text) for text in texts)
+        response = self._post(data)
+
+        try:
+            response.raise_for_status()
+            translations = [item['text'] for item in response.json()['translations']]
+        except (requests.HTTPError, KeyError, TypeError, ValueError) as e:
+            logging.error("Error extracting translations: %s", e)
+            raise ValueError("Translation response is invalid") from e
+        if len(translations) != len(texts):
+            raise ValueError("Translation response is invalid")
+        return translations
+
+    @staticmethod
+    def _chunks(texts):
+        return [texts[i:i + MAX_TEXTS_PER_REQUEST] for i in range(0, len(texts), MAX_TEXTS_PER_REQUEST)]
+
+    def translate_many(self, texts, target_lang):
+        chunks = self._chunks(list(texts))
+        if len(chunks) <= 1:
+            return self.translate_batch(chunks[0] if chunks else [], target_lang)
+        results = self._executor.get().map(lambda chunk: self.translate_batch(chunk, target_lang), chunks)
+        return [translation for batch in results for translation in batch]
+
+    def translate(self, text, target_lang):
+        return self.translate_batch([text], target_lang)[0]
+
+    async def translate_many_async(self, texts, target_lang):
+        """Asyncio counterpart of translate_many, bounded by the same concurrency limit."""
+        # A semaphore is tied to one event loop, so each call gets its own
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        loop = asyncio.get_running_loop()
+        executor = self._executor.get()
+
+        async def run(chunk):
+            async with semaphore:
+                return await loop.run_in_executor(executor, self.translate_batch, chunk, target_lang)
+
+        results = await asyncio.gather(*(run(chunk) for chunk in self._chunks(list(texts))))
+        return [translation for batch in results for translation in batch]
+
+    async def translate_async(self, text, target_lang):
+        return (await self.translate_many_async([text], target_lang))[0]
+
+    def close(self):
+        if self._executor.created:
+            self._executor.get().shutdown(wait=False)
+        if self._session.created:
+            self.session.close()
+
+
+class TranslationCache:
+    """Caches (text, target_lang) translations in memory and in a persistent store.
+
+    Misses are translated with one batched DeepL request per language, so a
+    fully cached quiz costs no upstream calls at all.
+    """
+
+    def __init__(self, client, store=None, maxsize=4096, ttl=24 * 60 * 60):
+        self.client = client
+        self.cache = TieredCache(LRUCache(maxsize=maxsize, ttl=ttl), store)
+
+    def warm_up(self):
+        self.client.warm_up()
+        self.cache.warm_up()
+
+    @staticmethod
+    def _key(text, target_lang):
+        return f"{target_lang}:{text}"
+
+    def translate_many(self, texts, target_lang):
+        target_lang = LANGUAGE_MAP.get(target_lang, target_lang)
+        keys = [self._key(text, target_lang) for text in texts]
+        try:
+            cached = self.cache.get_many(set(keys))
+        except Exception as e:
+            logging.error("Translation cache lookup failed: %s", e)
+            cached = {}
+
+        # Deduplicate misses while keeping the first-seen order
+        misses = list(dict.fromkeys(text for text, key in zip(texts, keys) if key not in cached))
+        if misses:
+            translations = self.client.translate_many(misses, target_lang)
+            fresh = {self._key(text, target_lang): translation for text, translation in zip(misses, translations)}
+            try:
+                self.cache.set_many(fresh)
+            except Exception as e:
+                logging.error("Translation cache write failed: %s", e)
+                for key, value in fresh.items():
+                    self.cache.memory.set(key, value)
+            cached.update(fresh)
+        return [cached[key] for key in keys]
+
+    def translate(self, text, target_lang):
+        return self.translate_many([text], target_lang)[0]
+
+
+def create_translation_store(backend=None, datastore_client=None, ttl=None):
+    """Build the persistent translation store selected by TRANSLATION_CACHE_BACKEND.
+
+    Defaults to Datastore in production (MODEL_BACKEND=datastore) and SQLite
+    otherwise; a SQLite file on a container's disk is lost on every restart.
+    Stored translations expire after TRANSLATION_CACHE_TTL seconds (30 days
+    by default) so a bad or outdated one doesn't outlive restarts forever.
+    """
+    backend = backend or os.getenv('TRANSLATION_CACHE_BACKEND') or default_store_backend()
+    ttl = ttl or int(os.getenv('TRANSLATION_CACHE_TTL', str(30 * 24 * 60 * 60)))
+    if backend == 'datastore':
+        return DatastoreStore(datastore_client, kind='TranslationCache', ttl=ttl)
+    if backend == 'sqlite':
+        path = os.getenv('TRANSLATION_CACHE_PATH', 'translation_cache.sqlite3')
+        return SQLiteStore(path, namespace='translations', ttl=ttl)
+    return None
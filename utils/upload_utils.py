@@ -0,0 +1,18 @@
+from tempfile import SpooledTemporaryFile
+from flask import Request, current_app
+
+# Uploads up to this size stay in memory; larger ones spill to a temp file
+DEFAULT_SPOOL_THRESHOLD = 4 * 1024 * 1024
+
+class SpooledRequest(Request):
+    """Request that parses uploaded files straight into a spooled buffer.
+
+    Werkzeug normally writes any upload above 500 KB to a temporary file. Here
+    the multipart stream is read once into a SpooledTemporaryFile that only
+    touches disk above UPLOAD_SPOOL_THRESHOLD, and that buffer is what
+    request.files exposes, so the rest of the request can reuse it.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        threshold = current_app.config.get('UPLOAD_SPOOL_THRESHOLD', DEFAULT_SPOOL_THRESHOLD)
+        return SpooledTemporaryFile(max_size=threshold, mode='w+b')
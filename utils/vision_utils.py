@@ -1,37 +1,189 @@
 import os
 import io
-import time
-from google.cloud import vision
+import math
+import hashlib
+import logging
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from PIL import Image
+from utils.client_utils import LazyClient
+from utils.cache_utils import LRUCache, SQLiteStore, DatastoreStore, TieredCache, default_store_backend
+from utils.storage_utils import LocalStorage, THUMBNAIL_SUFFIX
+from utils.metrics_utils import timed
 
-def detect_objects(image_path):
-    client = vision.ImageAnnotatorClient()
-    with io.open(image_path, 'rb') as image_file:
-        content = image_file.read()
-    image = vision.Image(content=content)
-    response = client.object_localization(image=image)
-    objects = response.localized_object_annotations
+# Plain, cacheable view of a Vision localized object annotation
+DetectedObject = namedtuple('DetectedObject', ['name', 'score', 'vertices'])
+
+IMAGE_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+# JPEG is by far the cheapest to encode; pass image_format='WEBP' for smaller files
+DEFAULT_IMAGE_FORMAT = 'JPEG'
+
+# Uploads are never decoded larger than this on their longest side
+MAX_DECODE_SIZE = 2048
+
+# Pillow releases the GIL while encoding, so crops run well on threads
+crop_executor = LazyClient(lambda: ThreadPoolExecutor(max_workers=4))
+
+def _create_vision_client():
+    # Imported here because google.cloud.vision is slow to import and only needed once serving
+    from google.cloud import vision
+    return vision.ImageAnnotatorClient()
+
+vision_client = LazyClient(_create_vision_client)
+
+def get_vision_client():
+    """Return this process's shared Vision client, creating it on first use."""
+    return vision_client.get()
+
+def create_detection_cache(backend=None, datastore_client=None, maxsize=256, max_entries=10000, ttl=None):
+    """Build the detection cache; the persistent tier is chosen by VISION_CACHE_BACKEND.
+
+    Defaults to Datastore in production (MODEL_BACKEND=datastore) and SQLite
+    otherwise. Stored detections expire after VISION_CACHE_TTL seconds (7 days
+    by default); the SQLite tier is also capped at max_entries.
+    """
+    backend = backend or os.getenv('VISION_CACHE_BACKEND') or default_store_backend()
+    ttl = ttl or int(os.getenv('VISION_CACHE_TTL', str(7 * 24 * 60 * 60)))
+    if backend == 'datastore':
+        store = DatastoreStore(datastore_client, kind='VisionCache', ttl=ttl)
+    elif backend == 'sqlite':
+        path = os.getenv('VISION_CACHE_PATH', 'vision_cache.sqlite3')
+        store = SQLiteStore(path, namespace='detections', max_entries=max_entries, ttl=ttl)
+    else:
+        store = None
+    return TieredCache(LRUCache(maxsize=maxsize), store)
+
+def _to_detected_objects(annotations):
     unique_objects = []
     seen_names = set()
-    for obj in objects:
+    for obj in annotations:
         if obj.name not in seen_names:
-            unique_objects.append(obj)
+            vertices = [(vertex.x, vertex.y) for vertex in obj.bounding_poly.normalized_vertices]
+            unique_objects.append(DetectedObject(obj.name, obj.score, vertices))
             seen_names.add(obj.name)
     return unique_objects
 
-def extract_objects(image_path, objects):
-    image = Image.open(image_path)
-    extracted_objects = []
-    for index, obj in enumerate(objects):
-        vertices = [(vertex.x, vertex.y) for vertex in obj.bounding_poly.normalized_vertices]
-        x_min = min(vertex[0] for vertex in vertices) * image.width
-        y_min = min(vertex[1] for vertex in vertices) * image.height
-        x_max = max(vertex[0] for vertex in vertices) * image.width
-        y_max = max(vertex[1] for vertex in vertices) * image.height
-        cropped_image = image.crop((x_min, y_min, x_max, y_max))
-        timestamp = int(time.time() * 1000)
-        extracted_filename = f'extracted_{timestamp}_{index}.png'
-        extracted_path = os.path.join('extracted', extracted_filename)
-        cropped_image.save(extracted_path)
-        extracted_objects.append(f'{extracted_filename}')
-    return extracted_objects
+def _read_image(image):
+    # Accept either a path or an open binary buffer, leaving a buffer rewound
+    if hasattr(image, 'read'):
+        image.seek(0)
+        content = image.read()
+        image.seek(0)
+        return content
+    with io.open(image, 'rb') as image_file:
+        return image_file.read()
+
+def detect_objects(image, cache=None):
+    content = _read_image(image)
+
+    # Identical uploads hash to the same key, so repeats skip the Vision call
+    digest = hashlib.sha256(content).hexdigest()
+    cached = None
+    if cache is not None:
+        try:
+            cached = cache.get_many([digest]).get(digest)
+        except Exception as e:
+            logging.error("Detection cache lookup failed: %s", e)
+        if cached is not None:
+            return [DetectedObject(obj['name'], obj['score'], [tuple(v) for v in obj['vertices']]) for obj in cached]
+
+    # A plain dict is accepted for the Image message, so google.cloud.vision is only
+    # imported by _create_vision_client and a stub client needs no Google libraries
+    with timed('vision_object_localization'):
+        response = get_vision_client().object_localization(image={'content': content})
+    # Failed annotations come back with an empty object list; never cache those
+    error = getattr(response, 'error', None)
+    if error is not None and error.message:
+        raise RuntimeError(f"Vision object localization failed: {error.message}")
+    unique_objects = _to_detected_objects(response.localized_object_annotations)
+    if cache is not None:
+        try:
+            cache.set_many({digest: [obj._asdict() for obj in unique_objects]})
+        except Exception as e:
+            logging.error("Detection cache write failed: %s", e)
+    return unique_objects
+
+@timed('image_decode')
+def _open_for_cropping(source, max_decode_size):
+    if hasattr(source, 'seek'):
+        source.seek(0)
+    image = Image.open(source)
+    # JPEGs can be decoded straight at a reduced scale. draft only picks a
+    # scale that keeps the image at or above the requested size, so ask for
+    # the size after rounding the factor up, then reduce whatever is left
+    factor = math.ceil(max(image.size) / max_decode_size)
+    if image.format == 'JPEG' and factor > 1:
+        image.draft('RGB', (image.width // factor, image.height // factor))
+    image.load()
+    factor = math.ceil(max(image.size) / max_decode_size)
+    if factor > 1:
+        image = image.reduce(factor)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'transparency' in image.info or image.mode in ('LA', 'PA') else 'RGB')
+    return image
+
+def _encode(image, image_format, quality):
+    buffer = io.BytesIO()
+    if image_format == 'WEBP':
+        # Pillow's default WebP effort costs more CPU than the PNGs this replaced
+        image.save(buffer, image_format, quality=quality, method=0)
+    else:
+        image.save(buffer, image_format, quality=quality, optimize=False)
+    return buffer.getvalue()
+
+@timed('crop_encode')
+def _crop_and_encode(image, obj, storage, image_format, max_size, thumbnail_size):
+    vertices = obj.vertices
+    x_min = min(vertex[0] for vertex in vertices) * image.width
+    y_min = min(vertex[1] for vertex in vertices) * image.height
+    x_max = max(vertex[0] for vertex in vertices) * image.width
+    y_max = max(vertex[1] for vertex in vertices) * image.height
+    cropped_image = image.crop((round(x_min), round(y_min), round(x_max), round(y_max)))
+    if image_format == 'JPEG' and cropped_image.mode != 'RGB':
+        cropped_image = cropped_image.convert('RGB')
+
+    cropped_image.thumbnail((max_size, max_size))
+    data = _encode(cropped_image, image_format, 80)
+    width, height = cropped_image.size
+
+    # Name crops by content so identical crops share a file and URLs never change
+    extension = IMAGE_EXTENSIONS[image_format]
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    extracted_filename = f'{digest}.{extension}'
+    storage.save(extracted_filename, data)
+
+    cropped_image.thumbnail((thumbnail_size, thumbnail_size))
+    thumbnail_filename = f'{digest}{THUMBNAIL_SUFFIX}.{extension}'
+    storage.save(thumbnail_filename, _encode(cropped_image, image_format, 70))
+
+    return {
+        'filename': extracted_filename,
+        'thumbnail': thumbnail_filename,
+        'width': width,
+        'height': height
+    }
+
+def extract_objects(image, objects, storage=None, max_size=1024, thumbnail_size=256,
+                    image_format=None, max_decode_size=MAX_DECODE_SIZE, on_object=None):
+    """Crop every object out of an image path or buffer and write size-capped copies plus thumbnails.
+
+    The image is decoded once and the crops are encoded concurrently, then
+    saved to storage (the local extracted/ directory by default) under
+    content-hash names. Returns one dict per object with the crop and
+    thumbnail filenames and the crop's output dimensions, in the same order
+    as objects. If given, on_object is called with (index, result) as soon
+    as each crop has been written.
+    """
+    storage = storage or LocalStorage('extracted')
+    image_format = image_format or DEFAULT_IMAGE_FORMAT
+    image = _open_for_cropping(image, max_decode_size)
+    futures = [
+        crop_executor.get().submit(_crop_and_encode, image, obj, storage, image_format, max_size, thumbnail_size)
+        for obj in objects
+    ]
+    if on_object is not None:
+        indexes = {future: index for index, future in enumerate(futures)}
+        for future in as_completed(futures):
+            on_object(indexes[future], future.result())
+    return [future.result() for future in futures]